@@ -0,0 +1,266 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import sistem_vs_xml as sx
+
+# Início das datas de emissão geradas (o período do benchmark parte daqui)
+DATA_BASE = datetime(2026, 5, 1)
+
+# Naturezas de operação geradas: a maioria é venda, como no compartilhamento real
+NATUREZAS = ['VENDA'] * 17 + ['DEVOLUÇÃO', 'REMESSA', 'BONIFICAÇÃO']
+
+# Encodings dos XMLs gerados, com o peso de cada um
+ENCODINGS_XML = [('utf-8', 60), ('iso-8859-1', 30), ('utf-8-sig', 6), ('utf-16', 4)]
+
+# Produtos usados nos itens das notas e no fechamento
+PRODUTOS = [(100 + i, f"PRODUTO {nome} {i}") for i, nome in
+            enumerate(['AÇÚCAR', 'FEIJÃO', 'LINGUIÇA', 'MAÇÃ', 'PÃO', 'CAFÉ', 'ARROZ', 'ÓLEO'] * 4)]
+
+def formatar_numero_br(valor, casas=2):
+    """1234.5 -> '1.234,50' (formato dos CSVs do sistema)"""
+    return f"{valor:,.{casas}f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+def montar_xml_nfe(numero, romaneio, natureza, emissao, itens, encoding):
+    """Monta o XML de uma NF-e (nfeProc com namespace) no encoding pedido"""
+    nome_encoding = 'utf-8' if encoding == 'utf-8-sig' else encoding
+    dets = ''.join(
+        f'<det nItem="{k}"><prod><cProd>{codigo}</cProd><xProd>{descricao}</xProd><uCom>KG</uCom>'
+        f'<qCom>{quantidade:.4f}</qCom><vUnCom>{preco:.10f}</vUnCom><vProd>{quantidade * preco:.2f}</vProd></prod>'
+        f'<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST></ICMS00></ICMS></imposto></det>'
+        for k, (codigo, descricao, quantidade, preco) in enumerate(itens, 1)
+    )
+    valor_total = sum(round(quantidade * preco, 2) for _, _, quantidade, preco in itens)
+    xml = (
+        f'<?xml version="1.0" encoding="{nome_encoding}"?>'
+        f'<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><NFe xmlns="http://www.portalfiscal.inf.br/nfe">'
+        f'<infNFe Id="NFe352605{numero:038d}" versao="4.00"><ide><cUF>35</cUF><cNF>{romaneio:08d}</cNF>'
+        f'<natOp>{natureza}</natOp><mod>55</mod><serie>1</serie><nNF>{numero}</nNF>'
+        f'<dhEmi>{emissao:%Y-%m-%dT%H:%M:%S}-03:00</dhEmi><tpNF>1</tpNF></ide>'
+        f'<emit><CNPJ>12345678000199</CNPJ><xNome>DISTRIBUIDORA SÃO JOÃO LTDA</xNome></emit>'
+        f'<dest><CNPJ>98765432000155</CNPJ><xNome>MERCADO CONCEIÇÃO</xNome></dest>{dets}'
+        f'<total><ICMSTot><vProd>{valor_total:.2f}</vProd><vNF>{valor_total:.2f}</vNF></ICMSTot></total>'
+        f'</infNFe></NFe><protNFe versao="4.00"><infProt><cStat>100</cStat></infProt></protNFe></nfeProc>'
+    )
+    return xml.encode(encoding)
+
+def gerar_compartilhamento(raiz, notas=1000, dias=30, semente=1):
+    """Gera em raiz uma cópia sintética do S:\\hor (XMLs, eventos, recusado e CSVs); devolve raízes e CSVs"""
+    aleatorio = random.Random(semente)
+    raizes = [os.path.join(raiz, 'nfe'), os.path.join(raiz, 'nfe2')]
+    caminhos_xml, caminhos_eventos, caminhos_recusado = sx.montar_caminhos_nfe(raizes)
+    pasta_excel = os.path.join(raiz, 'excel')
+    pasta_cancelados = os.path.join(raiz, 'arquivos')
+    for pasta in caminhos_xml + caminhos_eventos + caminhos_recusado + [pasta_excel, pasta_cancelados]:
+        os.makedirs(pasta, exist_ok=True)
+
+    encodings = [encoding for encoding, peso in ENCODINGS_XML for _ in range(peso)]
+    linhas_fechamento = ['LOJA;RAZAO;GRUPO;ROMANEIO;NF-E;DATA;VENDEDOR;CODPRODUTO;GRUPO PRODUTO;DESCRICAO;PRECO VENDA;CUSTO']
+    linhas_historico = ['ROMANEIO;NOTA FISCAL;PRODUTO;HISTORICO;PESO;USUARIO']
+    cancelados = []
+
+    for numero in range(1, notas + 1):
+        romaneio = 50000 + numero
+        emissao = DATA_BASE + timedelta(seconds=aleatorio.randrange(dias * 86400))
+        natureza = aleatorio.choice(NATUREZAS)
+        itens = [(codigo, descricao, aleatorio.randint(1, 400000) / 1000, aleatorio.randint(100, 9999) / 100)
+                 for codigo, descricao in aleatorio.sample(PRODUTOS, aleatorio.randint(1, 8))]
+
+        nome = f"3526{numero:08d}-nfe.xml"
+        pasta = caminhos_xml[numero % len(caminhos_xml)]
+        conteudo = montar_xml_nfe(numero, romaneio, natureza, emissao, itens, aleatorio.choice(encodings))
+        with open(os.path.join(pasta, nome), 'wb') as f:
+            f.write(conteudo)
+        # Cópias da mesma nota em enviado: descartadas pela chave da nota (raízes têm precedência)
+        if aleatorio.random() < 0.02:
+            with open(os.path.join(caminhos_xml[len(raizes) + numero % len(raizes)], nome), 'wb') as f:
+                f.write(conteudo)
+
+        # Eventos: cancelamentos (alguns intempestivos) e inutilizações
+        sorteio = aleatorio.random()
+        raiz_evento = numero % len(raizes)
+        if sorteio < 0.05:
+            with open(os.path.join(caminhos_eventos[raiz_evento], f"{numero:08d}.can"), 'w') as f:
+                f.write('<retEvento><cStat>135</cStat></retEvento>')
+            if aleatorio.random() < 0.4:
+                codigo, mensagem = aleatorio.choice(sx.REGRAS_RECUSADO)
+                with open(os.path.join(caminhos_recusado[raiz_evento], f"ret{numero:08d}.txt"), 'w',
+                          encoding='iso-8859-1') as f:
+                    f.write(f"Retorno SEFAZ\n{codigo} : {mensagem}\n")
+        elif sorteio < 0.08:
+            tag, texto = aleatorio.choice(sx.REGRAS_INUTILIZACAO + [('xJust', 'TESTE DE INUTILIZACAO')])
+            with open(os.path.join(caminhos_eventos[raiz_evento], f"inu{numero:08d}.inu"), 'w',
+                      encoding='utf-8') as f:
+                f.write(f'<?xml version="1.0" encoding="utf-8"?><inutNFe><{tag}>{texto}{"." * aleatorio.randint(0, 4)}</{tag}></inutNFe>')
+        if aleatorio.random() < 0.01:
+            cancelados.append(numero)
+
+        # Fechamento e histórico: uma linha por item
+        for codigo, descricao, quantidade, preco in itens:
+            linhas_fechamento.append(';'.join([
+                str(numero % 7), f"CLIENTE {numero % 300}", f"G{numero % 5}", str(romaneio), str(numero),
+                f"{emissao:%d/%m/%Y}", f"VEND{numero % 9}", str(codigo), f"GRUPO {codigo % 4}", descricao,
+                formatar_numero_br(preco), formatar_numero_br(preco * 0.7)]))
+            linhas_historico.append(';'.join([
+                str(romaneio), str(numero), str(codigo), aleatorio.choice(['51', '51', '51', '68', '10']),
+                formatar_numero_br(quantidade, 3), 'SISTEMA']))
+
+    caminhos = {
+        'raizes': raizes,
+        'fechamento': os.path.join(pasta_excel, 'fechamento.csv'),
+        'cancelados': os.path.join(pasta_cancelados, 'can.csv'),
+        'historico': os.path.join(pasta_excel, 'historico.csv'),
+        'data_inicial': f"{DATA_BASE:%d/%m/%Y}",
+        'data_final': f"{DATA_BASE + timedelta(days=dias - 1):%d/%m/%Y}",
+    }
+    with open(caminhos['fechamento'], 'w', encoding='iso-8859-1') as f:
+        f.write('\n'.join(linhas_fechamento) + '\n')
+    with open(caminhos['historico'], 'w', encoding='iso-8859-1') as f:
+        f.write('\n'.join(linhas_historico) + '\n')
+    with open(caminhos['cancelados'], 'w', encoding='iso-8859-1') as f:
+        f.write('RELATÓRIO DE NOTAS CANCELADAS\n\nNF-E;MOTIVO\n' + ''.join(f"{n};CANCELADA\n" for n in cancelados))
+    return caminhos
+
+def medir(funcao, rastrear_memoria=False, **kwargs):
+    """Executa a função sem as mensagens de progresso; retorna (resultado, segundos, pico de memória em MB)"""
+    # O tracemalloc deixa o código bem mais lento: tempo e memória são medidos em execuções separadas
+    if rastrear_memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()):
+            resultado = funcao(**kwargs)
+    finally:
+        segundos = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1] if rastrear_memoria else 0
+        if rastrear_memoria:
+            tracemalloc.stop()
+    return resultado, segundos, pico / 1024 / 1024
+
+def executar_cenarios(caminhos, pasta_trabalho, workers=1, repeticoes=1):
+    """Roda os cenários cronometrados e retorna {cenário: métricas} (melhor tempo das repetições)"""
+    resultados = {}
+
+    def registrar(nome, funcao, unidade, contar, **kwargs):
+        _, _, pico = medir(funcao, rastrear_memoria=True, **kwargs)
+        saida, segundos = None, None
+        for _ in range(repeticoes):
+            saida, tempo, _ = medir(funcao, **kwargs)
+            segundos = tempo if segundos is None else min(segundos, tempo)
+        quantidade = contar(saida)
+        resultados[nome] = {
+            'segundos': round(segundos, 4),
+            'quantidade': quantidade,
+            'unidade': unidade,
+            'por_segundo': round(quantidade / segundos, 1) if segundos else None,
+            'pico_memoria_mb': round(pico, 2),
+        }
+        print(f"   {nome:<28} {segundos:8.3f}s  {resultados[nome]['por_segundo'] or 0:>12,.1f} {unidade}/s  "
+              f"pico {pico:8.1f} MB")
+        return saida
+
+    caminho_indice = os.path.join(pasta_trabalho, 'indice.sqlite')
+    resumo_xml = {}
+    parametros_xml = dict(workers=workers, data_inicial=caminhos['data_inicial'], data_final=caminhos['data_final'],
+                          raizes=caminhos['raizes'], resumo=resumo_xml)
+    contar_arquivos = lambda _: resumo_xml.get('arquivos_encontrados', 0)
+
+    registrar('xml_sem_indice', sx.buscar_xml_por_data, 'arquivos', contar_arquivos,
+              caminho_indice=None, **parametros_xml)
+
+    def xml_indice_frio(**kwargs):
+        if os.path.exists(caminho_indice):
+            os.remove(caminho_indice)
+        return sx.buscar_xml_por_data(caminho_indice=caminho_indice, **kwargs)
+    registrar('xml_indice_frio', xml_indice_frio, 'arquivos', contar_arquivos, **parametros_xml)
+    df_xml = registrar('xml_indice_quente', sx.buscar_xml_por_data, 'arquivos', contar_arquivos,
+                       caminho_indice=caminho_indice, **parametros_xml)
+
+    contar_linhas = lambda df: 0 if df is None else len(df)
+    df_faturamento = registrar('faturamento', sx.processar_faturamento_bruto, 'linhas', contar_linhas,
+                               caminho_fechamento=caminhos['fechamento'], caminho_cancelados=caminhos['cancelados'],
+                               caminho_historico=caminhos['historico'])
+    # A rodada com tracemalloc preenche o cache: as repetições medem o acerto
+    registrar('faturamento_cache_quente', sx.processar_faturamento_bruto, 'linhas', contar_linhas,
+              caminho_fechamento=caminhos['fechamento'], caminho_cancelados=caminhos['cancelados'],
+              caminho_historico=caminhos['historico'], pasta_cache_csv=os.path.join(pasta_trabalho, 'cache_csv'))
+    registrar('faturamento_em_blocos', sx.processar_faturamento_bruto, 'linhas', contar_linhas,
+              caminho_fechamento=caminhos['fechamento'], caminho_cancelados=caminhos['cancelados'],
+              caminho_historico=caminhos['historico'], tamanho_bloco=sx.TAMANHO_BLOCO_CSV // 10)
+
+    linhas_excel = contar_linhas(df_xml) + contar_linhas(df_faturamento)
+    for nome, streaming in [('excel_streaming', True), ('excel_em_memoria', False)]:
+        registrar(nome, sx.criar_tabela_excel_com_formatacao, 'linhas', lambda _: linhas_excel,
+                  df_xml=df_xml, df_faturamento=df_faturamento, streaming=streaming,
+                  caminho_excel=os.path.join(pasta_trabalho, f"{nome}.xlsx"))
+
+    return resultados
+
+def comparar_com_base(resultados, caminho_base, limite):
+    """Aponta cenários mais lentos que a base além do limite (ex.: 1.25 = 25%); retorna True se nenhum"""
+    with open(caminho_base, 'r', encoding='utf-8') as f:
+        base = json.load(f)['cenarios']
+
+    sem_regressao = True
+    for nome, metricas in resultados.items():
+        if nome not in base or not base[nome]['segundos']:
+            continue
+        razao = metricas['segundos'] / base[nome]['segundos']
+        if razao > limite:
+            sem_regressao = False
+            print(f"❌ {nome}: {metricas['segundos']:.3f}s contra {base[nome]['segundos']:.3f}s na base ({razao:.2f}x)")
+        else:
+            print(f"✅ {nome}: {razao:.2f}x a base")
+    return sem_regressao
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do Sistema x XML sobre um compartilhamento sintético")
+    parser.add_argument('--notas', type=int, default=2000, help="quantidade de NF-e geradas (padrão 2000)")
+    parser.add_argument('--dias', type=int, default=30, help="dias cobertos pelas datas de emissão (padrão 30)")
+    parser.add_argument('--semente', type=int, default=1, help="semente do gerador (mesma semente = mesmos arquivos)")
+    parser.add_argument('--pasta', help="onde gerar o compartilhamento (padrão: pasta temporária apagada no fim)")
+    parser.add_argument('--so-gerar', action='store_true', help="apenas gera o compartilhamento em --pasta e sai")
+    parser.add_argument('--workers', type=int, default=1, help="processos para leitura dos XMLs")
+    parser.add_argument('--repeticoes', type=int, default=1, help="repetições por cenário (vale o melhor tempo)")
+    parser.add_argument('--json', metavar='ARQUIVO', help="grava as métricas em JSON (serve de base depois)")
+    parser.add_argument('--base', metavar='ARQUIVO', help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument('--limite', type=float, default=1.25,
+                        help="razão de tempo aceita em relação à base (padrão 1.25)")
+    args = parser.parse_args()
+
+    if args.so_gerar and not args.pasta:
+        parser.error("--so-gerar exige --pasta")
+
+    pasta = args.pasta or tempfile.mkdtemp(prefix='bench_nfe_')
+    try:
+        print(f"⏳ Gerando {args.notas} notas em {pasta}...")
+        inicio = time.perf_counter()
+        caminhos = gerar_compartilhamento(os.path.join(pasta, 'hor'), args.notas, args.dias, args.semente)
+        print(f"✅ Compartilhamento gerado em {time.perf_counter() - inicio:.1f}s")
+        if args.so_gerar:
+            print(json.dumps(caminhos, ensure_ascii=False, indent=2))
+            sys.exit(0)
+
+        print(f"⏱️ Cenários ({args.notas} notas, {args.workers} worker(s), {args.repeticoes} repetição(ões))")
+        resultados = executar_cenarios(caminhos, pasta, args.workers, args.repeticoes)
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'notas': args.notas, 'dias': args.dias, 'semente': args.semente,
+                           'workers': args.workers, 'cenarios': resultados}, f, ensure_ascii=False, indent=2)
+            print(f"✅ Métricas gravadas em {args.json}")
+
+        if args.base and not comparar_com_base(resultados, args.base, args.limite):
+            sys.exit(1)
+    finally:
+        if not args.pasta:
+            shutil.rmtree(pasta, ignore_errors=True)
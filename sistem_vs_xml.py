@@ -1,19 +1,293 @@
 import os
+import re
+import sys
+import io
+import json
+import codecs
+import hashlib
+import mmap
+import sqlite3
+import time
+import heapq
+import cProfile
+import pstats
+import threading
+import tempfile
+import warnings
+import argparse
+import importlib.util
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import chardet
 from openpyxl import Workbook
-from openpyxl.worksheet.table import Table, TableStyleInfo
+from openpyxl.worksheet.table import Table, TableStyleInfo, TableColumn
+from openpyxl.worksheet.filters import AutoFilter
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, Alignment
+from openpyxl.cell import WriteOnlyCell
+
+# Índice persistente dos cabeçalhos das NF-e (chave: caminho + tamanho + mtime)
+CAMINHO_INDICE_NFE = os.path.join(str(Path.home()), ".sistem_vs_xml", "indice_nfe.sqlite")
+
+# Reparos únicos de índices antigos, em ordem (PRAGMA user_version = quantos já rodaram):
+# as linhas que atendem à condição têm o cabeçalho relido uma vez
+REPAROS_INDICE_NFE = (
+    "data_emissao IS NULL",  # cabeçalhos UTF-16/32 eram gravados sem data
+    "chave IS NULL",         # índices sem a coluna chave ('' = lida, sem chave)
+)
+
+def _padrao_campo_xml(tag):
+    """Regex em bytes para a primeira ocorrência de <tag> (com ou sem prefixo e atributos)"""
+    return re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?' + tag.encode('ascii') + rb'(?:\s[^>]*)?(?:/>|>([^<]*)<)')
+
+PADROES_CABECALHO_NFE = {campo: _padrao_campo_xml(campo) for campo in ('dhEmi', 'nNF', 'cNF', 'vNF', 'natOp')}
+
+# Identificação da nota para eliminar duplicatas: chave de acesso (Id do infNFe ou chNFe do protocolo)
+# ou, na falta dela, CNPJ do emitente + série + número
+PADRAO_ID_NFE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?infNFe\b[^>]*?\bId\s*=\s*["\']NFe(\d{44})["\']')
+PADRAO_CH_NFE = _padrao_campo_xml('chNFe')
+PADRAO_EMITENTE_NFE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?emit>\s*<(?:[A-Za-z_][\w.-]*:)?(?:CNPJ|CPF)>(\d+)<')
+PADRAO_SERIE_NFE = _padrao_campo_xml('serie')
+
+# Campos lidos de cada nota no processamento completo
+PADROES_CAMPOS_NFE = {campo: _padrao_campo_xml(campo) for campo in ('cNF', 'nNF', 'vNF', 'dhEmi')}
+
+# Janela inicial (bytes) da busca do dhEmi no pré-filtro; cresce 4x até achar a tag ou o arquivo acabar
+JANELA_INICIAL_DHEMI = 8 * 1024
+
+# Quantos XMLs sem dhEmi são listados no aviso do pré-filtro
+QTD_ARQUIVOS_SEM_DATA_LISTADOS = 5
+
+# Quantas duplicatas (descartado -> mantido) são listadas no aviso da varredura
+QTD_DUPLICATAS_LISTADAS = 5
+
+# Itens da nota no modo detalhado: bloco <prod> de cada <det> e os campos lidos dele
+PADRAO_PROD_NFE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?prod>(.*?)</(?:[A-Za-z_][\w.-]*:)?prod>', re.S)
+PADROES_ITEM_NFE = {campo: _padrao_campo_xml(campo) for campo in ('cProd', 'qCom', 'vUnCom', 'vProd')}
+
+# Largura máxima (caracteres) dos textos numéricos tratados pelos conversores vetorizados
+LARGURA_MAXIMA_NUMERO = 32
+
+# Bytes lidos do início do arquivo para identificar a codificação
+AMOSTRA_ENCODING = 64 * 1024
+
+# BOMs conhecidos (UTF-32 antes de UTF-16: o BOM UTF-32 LE começa com o UTF-16 LE)
+BOMS_ENCODING = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+PADRAO_DECLARACAO_XML = re.compile(rb'\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._:-]+)["\']')
+
+# Abaixo desta confiança o palpite do chardet é descartado em favor do cp1252
+CONFIANCA_MINIMA_CHARDET = 0.5
+
+# Codificação detectada por (diretório, extensão), reaproveitada para arquivos sem BOM/declaração
+_cache_encoding_diretorio = {}
+
+# Justificativas de inutilização (.inu) que removem a nota: (tag, texto). Pontos e espaços
+# no final, e espaços repetidos, são ignorados ("IMPOSTO ERRADO" vale para "IMPOSTO ERRADO.....")
+REGRAS_INUTILIZACAO = [
+    ('xJust', 'NOTA NAO AUTORIZADA'),
+    ('xJust', 'NOTA NAO APARECE NO SEFAZ'),
+    ('xServ', 'INUTILIZAR'),
+    ('xJust', 'ERRO NO SEFAZ'),
+    ('xJust', 'MERCADO NAO QUIS RECEBER'),
+    ('xJust', 'MERCADORIA FOI DUAS VEZES NO DIA'),
+    ('xJust', 'ERRO NA PESAGEM'),
+    ('xJust', 'NAO APARECE NO SEFAZ'),
+    ('xJust', 'IMPOSTO ERRADO'),
+    ('xJust', 'FORA DE HORARIO'),
+    ('xJust', 'NAO APARECEU NO SEFAZ'),
+    ('xJust', 'CARRO QUEBROU'),
+]
+
+# Rejeições no recusado que caracterizam cancelamento intempestivo: (código, mensagem)
+REGRAS_RECUSADO = [
+    ('501', 'Rejeição: Pedido de Cancelamento intempestivo'),
+    ('493', 'Rejeição: Evento não atende o Schema XML específico'),
+    ('221', 'Rejeição: Confirmado o recebimento da NF-e pelo destinatário'),
+    ('241', 'Rejeição: Um número da faixa já foi utilizado'),
+]
+
+# Arquivos enviados a cada worker por vez no modo paralelo
+TAMANHO_LOTE_XML = 64
+
+# Raízes das NF-e: cada uma tem XMLs na raiz e em enviado, além de eventos e recusado
+RAIZES_NFE = [r"S:\hor\nfe", r"S:\hor\nfe2"]
+
+# CSVs do faturamento bruto usados quando não informados na linha de comando
+CAMINHO_FECHAMENTO = r"S:\hor\excel\fechamento-20260501-20260513.csv"
+CAMINHO_CANCELADOS = r"S:\hor\arquivos\gustavo\can.csv"
+CAMINHO_HISTORICO = r"S:\hor\excel\20260501.csv"
+
+# Linhas por bloco na leitura em blocos do fechamento e do histórico
+TAMANHO_BLOCO_CSV = 200_000
+
+# Colunas usadas de cada CSV (o resto nem é carregado na leitura em blocos)
+COLUNAS_FECHAMENTO = ['LOJA', 'RAZAO', 'GRUPO', 'ROMANEIO', 'NF-E', 'DATA',
+                      'VENDEDOR', 'CODPRODUTO', 'GRUPO PRODUTO', 'DESCRICAO', 'PRECO VENDA']
+COLUNAS_HISTORICO = ['ROMANEIO', 'NOTA FISCAL', 'PRODUTO', 'HISTORICO', 'PESO']
+
+# Colunas de texto repetitivo guardadas como category; chaves guardadas em int32 quando cabem
+COLUNAS_CATEGORIA_FECHAMENTO = ['LOJA', 'RAZAO', 'GRUPO', 'DATA', 'VENDEDOR', 'GRUPO PRODUTO', 'DESCRICAO']
+COLUNAS_CHAVE_FECHAMENTO = ['ROMANEIO', 'NF-E', 'CODPRODUTO']
+
+# Cache dos CSVs já convertidos (Parquet), com limite de tamanho; mudar
+# VERSAO_CACHE_CSV invalida tudo (ex.: nova regra de conversão)
+PASTA_CACHE_CSV = os.path.join(str(Path.home()), ".sistem_vs_xml", "cache_csv")
+LIMITE_CACHE_CSV_MB = 512
+VERSAO_CACHE_CSV = 1
+
+# Diferença máxima (R$) entre FAT BRUTO e Valor XML para a nota ser considerada conciliada
+TOLERANCIA_CONCILIACAO = 0.01
+
+# Threads para listar diretórios e ler cabeçalhos (latência do drive de rede, não CPU)
+THREADS_LISTAGEM = 8
+
+# Modo observação: segundos entre verificações das pastas e segundos sem mudanças
+# antes de regravar as saídas (arquivos ainda sendo copiados não geram uma planilha por arquivo)
+INTERVALO_OBSERVACAO = 5
+ESPERA_GRAVACAO = 10
+# Com notificações do sistema, as pastas ainda são todas comparadas a cada tantos segundos
+# (shares de rede podem perder notificações)
+VARREDURA_COMPLETA_OBSERVACAO = 60
+
+# Contexto compartilhado pelos workers do modo paralelo (definido no initializer)
+_contexto_worker_xml = None
+
+# Quantos XMLs mais lentos entram no relatório de desempenho
+QTD_ARQUIVOS_LENTOS = 10
+
+# Métricas de desempenho da execução (tempo, arquivos e bytes por etapa + XMLs mais lentos)
+_metricas = {'inicio': time.perf_counter(), 'etapas': {}, 'arquivos_lentos': []}
+_trava_metricas = threading.Lock()
+
+def iniciar_metricas():
+    """Zera as métricas de desempenho para uma nova execução"""
+    with _trava_metricas:
+        _metricas['inicio'] = time.perf_counter()
+        _metricas['etapas'] = {}
+        _metricas['arquivos_lentos'] = []
+
+def registrar_etapa(nome, segundos, itens=0, bytes_lidos=0, chamadas=1):
+    """Acumula tempo, itens (arquivos ou linhas) e bytes lidos de uma etapa (seguro entre threads)"""
+    with _trava_metricas:
+        etapa = _metricas['etapas'].setdefault(nome, {'segundos': 0.0, 'chamadas': 0, 'itens': 0, 'bytes': 0})
+        etapa['segundos'] += segundos
+        etapa['chamadas'] += chamadas
+        etapa['itens'] += itens
+        etapa['bytes'] += bytes_lidos
+
+@contextmanager
+def medir_etapa(nome):
+    """Mede o bloco como a etapa nome; o dict devolvido recebe 'itens' e 'bytes'"""
+    contagem = {'itens': 0, 'bytes': 0}
+    inicio = time.perf_counter()
+    try:
+        yield contagem
+    finally:
+        registrar_etapa(nome, time.perf_counter() - inicio, contagem['itens'], contagem['bytes'])
+
+def registrar_arquivos_lentos(tempos):
+    """Guarda os QTD_ARQUIVOS_LENTOS mais lentos de uma lista de (segundos, caminho)"""
+    with _trava_metricas:
+        _metricas['arquivos_lentos'] = heapq.nlargest(QTD_ARQUIVOS_LENTOS, _metricas['arquivos_lentos'] + list(tempos))
+
+def mesclar_metricas(metricas):
+    """Soma nas métricas deste processo as métricas devolvidas por um worker"""
+    for nome, etapa in metricas['etapas'].items():
+        registrar_etapa(nome, etapa['segundos'], etapa['itens'], etapa['bytes'], etapa['chamadas'])
+    registrar_arquivos_lentos(metricas['arquivos_lentos'])
+
+def relatorio_metricas():
+    """Relatório de desempenho da execução (JSON); etapas em threads/processos somam o tempo de cada um"""
+    with _trava_metricas:
+        etapas = {nome: dict(etapa, segundos=round(etapa['segundos'], 4),
+                             mb_por_segundo=round(etapa['bytes'] / 1024 / 1024 / etapa['segundos'], 2)
+                             if etapa['bytes'] and etapa['segundos'] else None)
+                  for nome, etapa in _metricas['etapas'].items()}
+        return {
+            'duracao_s': round(time.perf_counter() - _metricas['inicio'], 4),
+            'etapas': etapas,
+            'arquivos_mais_lentos': [{'arquivo': caminho, 'segundos': round(segundos, 4)}
+                                     for segundos, caminho in _metricas['arquivos_lentos']],
+        }
+
+def _decodifica_amostra(amostra, encoding):
+    """Verifica se a amostra decodifica sem erro (tolerando caractere cortado no final)"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(amostra, final=False)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+def resolver_encoding(amostra, chave_cache=None):
+    """Resolve a codificação por BOM, declaração <?xml encoding?>, cache do diretório e, por último, chardet na amostra"""
+    for bom, encoding in BOMS_ENCODING:
+        if amostra.startswith(bom):
+            return encoding
+    
+    declaracao = PADRAO_DECLARACAO_XML.match(amostra)
+    if declaracao:
+        encoding = declaracao.group(1).decode('ascii')
+        # Emissores às vezes declaram UTF-8 e gravam Latin-1: só confia se a amostra decodificar
+        if _decodifica_amostra(amostra, encoding):
+            return encoding
+    
+    # UTF-8 válido (inclui ASCII puro) dificilmente é outra codificação; ASCII em UTF-8
+    # também aceita acentos que apareçam depois da amostra
+    if _decodifica_amostra(amostra, 'utf-8'):
+        return 'utf-8'
+    
+    # Codificações de 1 byte decodificam qualquer coisa: o cache só vale depois do teste de UTF-8
+    if chave_cache is not None:
+        encoding = _cache_encoding_diretorio.get(chave_cache)
+        if encoding and _decodifica_amostra(amostra, encoding):
+            return encoding
+    
+    with medir_etapa('chardet') as contagem:
+        deteccao = chardet.detect(amostra)
+        contagem['itens'], contagem['bytes'] = 1, len(amostra)
+    encoding = deteccao['encoding']
+    if encoding is None:
+        return 'utf-8'
+    
+    # Em português com pouca acentuação o chardet chuta com confiança mínima (koi8-t,
+    # Windows-1256, até EBCDIC cp424, que troca o próprio ASCII): vale o padrão do Windows
+    if (deteccao['confidence'] or 0) < CONFIANCA_MINIMA_CHARDET:
+        encoding = 'cp1252' if _decodifica_amostra(amostra, 'cp1252') else 'latin-1'
+    
+    if chave_cache is not None:
+        _cache_encoding_diretorio[chave_cache] = encoding
+    return encoding
 
 def detectar_encoding(arquivo):
-    """Detectar a codificação do arquivo"""
+    """Detectar a codificação do arquivo (BOM/declaração XML ou chardet numa amostra limitada)"""
     with open(arquivo, 'rb') as f:
-        resultado = chardet.detect(f.read())
-    return resultado['encoding']
+        amostra = f.read(AMOSTRA_ENCODING)
+    caminho = str(arquivo)
+    chave_cache = (os.path.dirname(caminho), os.path.splitext(caminho)[1].lower())
+    return resolver_encoding(amostra, chave_cache)
+
+def ler_xml_de_bytes(conteudo_bytes, chave_cache=None):
+    """Faz o parse direto dos bytes (o ElementTree decodifica pela declaração); se falhar, decodifica antes"""
+    try:
+        return ET.fromstring(conteudo_bytes)
+    except ET.ParseError:
+        # Declaração ausente/incorreta: decodificar com a codificação detectada no conteúdo
+        encoding = chardet.detect(conteudo_bytes[:AMOSTRA_ENCODING])['encoding'] or 'utf-8'
+        return ET.fromstring(conteudo_bytes.decode(encoding, errors='replace'))
 
 def converter_para_float(valor):
     """Converter valor para float, tratando vírgulas como separador decimal"""
@@ -41,6 +315,112 @@ def converter_para_int(valor):
     except (ValueError, TypeError):
         return 0
 
+def _decompor_textos_numericos(serie):
+    """Decompõe os textos numa matriz UCS-4: (vazias, mantissa, casas, n_digitos, n_virgulas, so_numerico, ascii)"""
+    valores = serie.to_numpy(dtype=object)
+    vazias = serie.isna().to_numpy()
+    
+    tipo = pd.api.types.infer_dtype(valores, skipna=True)
+    if tipo in ('string', 'empty'):
+        texto = ~vazias
+    else:
+        texto = np.fromiter((isinstance(v, str) for v in valores), dtype=bool, count=len(valores))
+    
+    valores = valores.copy()
+    valores[~texto] = ''
+    
+    # Uma coluna extra detecta textos maiores que a largura (ficam para a regra escalar)
+    largura = LARGURA_MAXIMA_NUMERO + 1
+    matriz = np.asarray(valores, dtype=f'U{largura}').view(np.uint32).reshape(len(valores), largura)
+    usadas = np.flatnonzero(matriz.any(axis=0))
+    largura_usada = usadas[-1] + 1 if len(usadas) else 0
+    longas = matriz[:, LARGURA_MAXIMA_NUMERO] != 0
+    # Colunas contíguas: cada passo abaixo opera sobre um vetor de 1 caractere por célula
+    colunas = np.ascontiguousarray(matriz[:, :min(largura_usada, LARGURA_MAXIMA_NUMERO)].T)
+    
+    quantidade = len(valores)
+    mantissa = np.zeros(quantidade, dtype=np.int64)
+    n_digitos = np.zeros(quantidade, dtype=np.int64)
+    n_virgulas = np.zeros(quantidade, dtype=np.int64)
+    casas = np.zeros(quantidade, dtype=np.int64)
+    apos_virgula = np.zeros(quantidade, dtype=bool)
+    so_numerico = texto & ~longas
+    ascii_ = texto & ~longas
+    
+    for caractere in colunas:
+        digito = (caractere >= 48) & (caractere <= 57)
+        virgula = caractere == 44
+        mantissa = np.where(digito, mantissa * 10 + (caractere.astype(np.int64) - 48), mantissa)
+        n_digitos += digito
+        n_virgulas += virgula
+        apos_virgula |= virgula
+        casas += digito & apos_virgula
+        so_numerico &= digito | virgula | (caractere == 46) | (caractere == 0)
+        ascii_ &= caractere < 128
+    
+    # Até 15 dígitos a mantissa é exata em float64 e mantissa / 10**casas coincide com float(texto)
+    curtas = n_digitos <= 15
+    return vazias, mantissa, casas, n_digitos, n_virgulas, so_numerico & curtas, ascii_ & curtas
+
+def converter_serie_para_float(serie):
+    """Versão vetorizada de converter_para_float (mesmas regras, sem chamada Python por célula)"""
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype('float64').fillna(0.0)
+    
+    vazias, mantissa, casas, n_digitos, n_virgulas, so_numerico, _ = _decompor_textos_numericos(serie)
+    
+    # '' , ',' e '1,2,3' não são números válidos após a troca de separadores: viram 0.0
+    validos = (n_digitos > 0) & (n_virgulas <= 1)
+    resultado = np.where(validos, mantissa / np.power(10.0, casas), 0.0)
+    
+    # Sinais, espaços internos, lixo e valores não textuais seguem a regra escalar
+    pendentes = ~so_numerico & ~vazias
+    if pendentes.any():
+        resultado[pendentes] = serie[pendentes].map(converter_para_float).to_numpy(dtype='float64')
+    return pd.Series(resultado, index=serie.index, name=serie.name)
+
+def converter_serie_para_int(serie):
+    """Versão vetorizada de converter_para_int (mesmas regras, sem chamada Python por célula)"""
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.fillna(0).astype('int64')
+    if pd.api.types.is_float_dtype(serie):
+        return serie.fillna(0.0).astype('int64')
+    
+    vazias, mantissa, casas, n_digitos, n_virgulas, _, ascii_ = _decompor_textos_numericos(serie)
+    
+    # Caracteres fora de dígitos/separadores são descartados; truncamento igual a int(float(...))
+    validos = (n_digitos > 0) & (n_virgulas <= 1)
+    resultado = np.where(validos, mantissa // np.power(10, casas, dtype=np.int64), 0)
+    
+    # Fora do ASCII, str.isdigit aceita caracteres que não são 0-9: esses seguem a regra escalar.
+    # Valores fora do int64 (ex.: chave de acesso de 44 dígitos na coluna NF-E) são lixo: viram 0
+    pendentes = ~ascii_ & ~vazias
+    if pendentes.any():
+        limite = np.iinfo(np.int64)
+        resultado[pendentes] = [valor if limite.min <= valor <= limite.max else 0
+                                for valor in serie[pendentes].map(converter_para_int)]
+    return pd.Series(resultado, index=serie.index, name=serie.name)
+
+def reais_para_centavos(valores):
+    """Valores em reais (float) como int64 de centavos, meio centavo arredondado para cima (em módulo)"""
+    # 6 casas antes: descarta o ruído do float (1.005 * 100 = 100.49999999999999) antes do meio centavo
+    centavos = np.round(np.asarray(valores, dtype='float64') * 100, 6)
+    return (np.sign(centavos) * np.floor(np.abs(centavos) + 0.5)).astype('int64')
+
+def centavos_xml(texto):
+    """Valor decimal do XML (ex.: vNF) em centavos exatos via Decimal, meio centavo arredondado para cima"""
+    return int(Decimal(texto.strip()).scaleb(2).to_integral_value(rounding=ROUND_HALF_UP))
+
+def total_em_reais(serie):
+    """Soma exata de uma coluna em reais: cada valor vira centavos e a soma é feita em int64"""
+    return int(reais_para_centavos(serie.fillna(0.0)).sum()) / 100
+
+def calcular_fat_bruto(df):
+    """FAT BRUTO de cada linha (PRECO VENDA * PESO) arredondado ao centavo, em reais"""
+    return pd.Series(reais_para_centavos(df['PRECO VENDA'] * df['PESO']) / 100, index=df.index)
+
+FORMATO_DATA_NOTA = '%d/%m/%Y %H:%M'  # DATA das notas (formatar_data e exibição no Excel/CSV)
+
 def formatar_data(data_xml):
     """Converte a data do formato XML para formato legível"""
     try:
@@ -51,51 +431,314 @@ def formatar_data(data_xml):
         else:
             data_dt = datetime.strptime(data_str, '%Y-%m-%d %H:%M:%S')
         
-        return data_dt.strftime('%d/%m/%Y %H:%M')
+        return data_dt.strftime(FORMATO_DATA_NOTA)
     except Exception:
         return data_xml
 
+def ler_inicio_xml(caminho_arquivo, padrao, janela_inicial=JANELA_INICIAL_DHEMI):
+    """Bytes do início do XML até onde o campo aparece (janela crescente, mmap); UTF-16/32 vira UTF-8"""
+    with open(caminho_arquivo, 'rb') as f:
+        inicio_arquivo = f.read(janela_inicial)
+        encoding = next((enc for bom, enc in BOMS_ENCODING if inicio_arquivo.startswith(bom)), None)
+        if encoding in ('utf-16', 'utf-32'):
+            return (inicio_arquivo + f.read()).decode(encoding, errors='ignore').encode('utf-8')
+        
+        if len(inicio_arquivo) < janela_inicial or padrao.search(inicio_arquivo) is not None:
+            return inicio_arquivo
+        
+        tamanho = os.fstat(f.fileno()).st_size
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            fim, janela = janela_inicial, janela_inicial * 4
+            while fim < tamanho:
+                # Recomeça um pouco antes do fim da janela anterior: a tag pode ter ficado cortada
+                inicio, fim = max(0, fim - 256), min(janela, tamanho)
+                if padrao.search(mapa, inicio, fim) is not None:
+                    break
+                janela *= 4
+            return mapa[:fim]
+
+def extrair_chave_nfe(conteudo):
+    """Identificação da nota: chave de acesso (Id/chNFe) ou CNPJ-série-número; None se não houver"""
+    encontrado = PADRAO_ID_NFE.search(conteudo)
+    if encontrado is None:
+        encontrado = PADRAO_CH_NFE.search(conteudo)
+    if encontrado is not None and encontrado.group(1):
+        return encontrado.group(1).decode('ascii', errors='ignore').strip()
+    
+    partes = [padrao.search(conteudo) for padrao in (PADRAO_EMITENTE_NFE, PADRAO_SERIE_NFE, PADROES_CABECALHO_NFE['nNF'])]
+    if all(parte is not None and parte.group(1) for parte in partes):
+        return '-'.join(parte.group(1).decode('ascii', errors='ignore').strip() for parte in partes)
+    return None
+
+def extrair_data_e_chave_rapido_xml(caminho_arquivo):
+    """(data de emissão, chave da nota) do início do XML, numa só leitura; (None, None) se ilegível"""
+    try:
+        padrao = PADROES_CABECALHO_NFE['dhEmi']
+        with medir_etapa('leitura_cabecalhos') as contagem:
+            trecho = ler_inicio_xml(caminho_arquivo, padrao)
+            contagem['itens'], contagem['bytes'] = 1, len(trecho)
+        
+        encontrado = padrao.search(trecho)
+        data_emissao = None
+        if encontrado is not None and encontrado.group(1):
+            data_emissao = converter_dh_emi_para_data(encontrado.group(1).decode('ascii', errors='ignore').strip())
+        return data_emissao, extrair_chave_nfe(trecho)
+        
+    except Exception:
+        return None, None
+
 def extrair_data_rapido_xml(caminho_arquivo):
-    """Extrai a data de emissão do XML de forma RÁPIDA (apenas leitura parcial)"""
+    """Extrai a data de emissão do XML de forma RÁPIDA (dhEmi buscado nos bytes, sem ler o arquivo todo)"""
+    return extrair_data_e_chave_rapido_xml(caminho_arquivo)[0]
+
+def converter_dh_emi_para_data(data_str):
+    """Converte o texto do dhEmi para date (ou None se inválido)"""
     try:
-        # Ler apenas os primeiros 5000 bytes onde geralmente está a data
+        data_str = data_str.split('-03:00')[0] if '-03:00' in data_str else data_str.split('-04:00')[0] if '-04:00' in data_str else data_str
+
+        if 'T' in data_str:
+            return datetime.strptime(data_str, '%Y-%m-%dT%H:%M:%S').date()
+        return datetime.strptime(data_str, '%Y-%m-%d %H:%M:%S').date()
+    except Exception:
+        return None
+
+def extrair_cabecalho_xml(caminho_arquivo):
+    """Extrai dhEmi, nNF, cNF, vNF, natOp e a chave da nota do XML para o índice persistente"""
+    with medir_etapa('leitura_cabecalhos') as contagem:
         with open(caminho_arquivo, 'rb') as f:
-            conteudo_bytes = f.read(5000)
-        
-        # Detectar encoding
-        resultado = chardet.detect(conteudo_bytes)
-        encoding = resultado['encoding']
-        
-        # Converter para string
-        conteudo = conteudo_bytes.decode(encoding, errors='ignore')
-        
-        # Buscar padrão de data no XML (dhEmi)
-        if 'dhEmi' in conteudo:
-            # Encontrar a tag dhEmi
-            start_idx = conteudo.find('<dhEmi>')
-            if start_idx != -1:
-                start_idx += 7  # Tamanho de '<dhEmi>'
-                end_idx = conteudo.find('</dhEmi>', start_idx)
-                if end_idx != -1:
-                    data_str = conteudo[start_idx:end_idx]
-                    
-                    # Limpar timezone
-                    data_str = data_str.split('-03:00')[0] if '-03:00' in data_str else data_str.split('-04:00')[0] if '-04:00' in data_str else data_str
-                    
-                    if 'T' in data_str:
-                        data_dt = datetime.strptime(data_str, '%Y-%m-%dT%H:%M:%S')
-                    else:
-                        data_dt = datetime.strptime(data_str, '%Y-%m-%d %H:%M:%S')
-                    
-                    return data_dt.date()
-        
+            conteudo_bytes = f.read()
+        contagem['itens'], contagem['bytes'] = 1, len(conteudo_bytes)
+
+    encoding = None
+    # UTF-16/32 (raro): converter para UTF-8, senão as tags não aparecem nos bytes
+    if conteudo_bytes.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        conteudo_bytes, encoding = conteudo_bytes.decode('utf-32', errors='ignore').encode('utf-8'), 'utf-8'
+    elif conteudo_bytes.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        conteudo_bytes, encoding = conteudo_bytes.decode('utf-16', errors='ignore').encode('utf-8'), 'utf-8'
+
+    cabecalho = {}
+    for campo, padrao in PADROES_CABECALHO_NFE.items():
+        encontrado = padrao.search(conteudo_bytes)
+        cabecalho[campo] = encontrado.group(1) if encontrado else None
+
+    # Apenas natOp pode ter acentos; os demais campos são ASCII
+    if cabecalho['natOp'] is not None:
+        encoding = encoding or resolver_encoding(conteudo_bytes[:AMOSTRA_ENCODING])
+        cabecalho['natOp'] = cabecalho['natOp'].decode(encoding, errors='ignore')
+    for campo in ('dhEmi', 'nNF', 'cNF', 'vNF'):
+        if cabecalho[campo] is not None:
+            cabecalho[campo] = cabecalho[campo].decode('ascii', errors='ignore').strip()
+    cabecalho['chave'] = extrair_chave_nfe(conteudo_bytes)
+
+    return cabecalho
+
+def abrir_indice_nfe(caminho_indice):
+    """Abre (ou cria) o índice SQLite dos cabeçalhos das NF-e"""
+    os.makedirs(os.path.dirname(caminho_indice) or '.', exist_ok=True)
+    conexao = sqlite3.connect(caminho_indice, timeout=30)
+    conexao.execute("""
+        CREATE TABLE IF NOT EXISTS cabecalhos_nfe (
+            caminho TEXT PRIMARY KEY,
+            diretorio TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            dh_emi TEXT,
+            data_emissao TEXT,
+            nnf INTEGER,
+            cnf INTEGER,
+            vnf TEXT,
+            nat_op TEXT,
+            chave TEXT
+        )
+    """)
+    # Índices criados antes da chave da nota ganham a coluna (preenchida pelos reparos abaixo)
+    colunas = {linha[1] for linha in conexao.execute("PRAGMA table_info(cabecalhos_nfe)")}
+    if 'chave' not in colunas:
+        conexao.execute("ALTER TABLE cabecalhos_nfe ADD COLUMN chave TEXT")
+    conexao.execute("CREATE INDEX IF NOT EXISTS idx_cabecalhos_data ON cabecalhos_nfe (diretorio, data_emissao)")
+    # mtime inválido faz a próxima sincronização reler a linha
+    versao = conexao.execute("PRAGMA user_version").fetchone()[0]
+    if versao < len(REPAROS_INDICE_NFE):
+        for condicao in REPAROS_INDICE_NFE[versao:]:
+            conexao.execute(f"UPDATE cabecalhos_nfe SET mtime_ns = -1 WHERE {condicao}")
+        conexao.execute(f"PRAGMA user_version = {len(REPAROS_INDICE_NFE)}")
+        conexao.commit()
+    # Resultados da última execução incremental (reaproveitados se arquivo e eventos não mudaram)
+    conexao.execute("""
+        CREATE TABLE IF NOT EXISTS resultados_nfe (
+            caminho TEXT PRIMARY KEY,
+            tamanho INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            assinatura_eventos TEXT NOT NULL,
+            resultado TEXT
+        )
+    """)
+    return conexao
+
+def _extrair_cabecalho_ou_none(caminho_arquivo):
+    """extrair_cabecalho_xml para uso em thread: arquivo inacessível vira None"""
+    try:
+        return extrair_cabecalho_xml(caminho_arquivo)
+    except OSError:
         return None
-        
+
+def atualizar_indice_diretorio(conexao, diretorio, entries, executor=None, sem_data=None):
+    """Sincroniza o índice com a listagem do diretório; só arquivos novos/alterados são lidos"""
+    conhecidos = {
+        caminho: (tamanho, mtime_ns)
+        for caminho, tamanho, mtime_ns in conexao.execute(
+            "SELECT caminho, tamanho, mtime_ns FROM cabecalhos_nfe WHERE diretorio = ?", (diretorio,))
+    }
+
+    presentes = set()
+    alterados = []
+    for entry in entries:
+        caminho_completo = os.path.join(diretorio, entry.name)
+        presentes.add(caminho_completo)
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+
+        if conhecidos.get(caminho_completo) != (stat.st_size, stat.st_mtime_ns):
+            alterados.append((entry, caminho_completo, stat))
+
+    caminhos_alterados = [caminho_completo for _, caminho_completo, _ in alterados]
+    if executor is not None:
+        cabecalhos = executor.map(_extrair_cabecalho_ou_none, caminhos_alterados)
+    else:
+        cabecalhos = map(_extrair_cabecalho_ou_none, caminhos_alterados)
+
+    novos = 0
+    for (entry, caminho_completo, stat), cabecalho in zip(alterados, cabecalhos):
+        if cabecalho is None:
+            continue
+
+        data_emissao = converter_dh_emi_para_data(cabecalho['dhEmi']) if cabecalho['dhEmi'] else None
+        if data_emissao is None and sem_data is not None:
+            sem_data.add(entry.name)
+        conexao.execute(
+            "INSERT OR REPLACE INTO cabecalhos_nfe VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (caminho_completo, diretorio, entry.name, stat.st_size, stat.st_mtime_ns,
+             cabecalho['dhEmi'], data_emissao.isoformat() if data_emissao else None,
+             converter_para_int(cabecalho['nNF']), converter_para_int(cabecalho['cNF']),
+             cabecalho['vNF'], cabecalho['natOp'], cabecalho['chave'] or '')
+        )
+        novos += 1
+
+    # Remover do índice arquivos que não existem mais
+    removidos = [(caminho,) for caminho in conhecidos if caminho not in presentes]
+    if removidos:
+        conexao.executemany("DELETE FROM cabecalhos_nfe WHERE caminho = ?", removidos)
+
+    conexao.commit()
+    return novos
+
+def consultar_indice_periodo(conexao, diretorio, data_inicial, data_final):
+    """Retorna (nome, caminho, natOp, data de emissão ISO, chave) dos XMLs do diretório emitidos no período"""
+    return conexao.execute(
+        "SELECT nome, caminho, nat_op, data_emissao, chave FROM cabecalhos_nfe "
+        "WHERE diretorio = ? AND data_emissao BETWEEN ? AND ? ORDER BY nome",
+        (diretorio, data_inicial.isoformat(), data_final.isoformat())
+    ).fetchall()
+
+def _texto_flexivel(texto):
+    """Regex do texto aceitando qualquer quantidade de espaços entre as palavras"""
+    return r'\s+'.join(re.escape(palavra) for palavra in texto.split())
+
+def compilar_regras(fragmentos, rotulos):
+    """Junta as regras numa única regex; o grupo que casou identifica a regra"""
+    padrao = re.compile('|'.join(f'(?P<r{i}>{fragmento})' for i, fragmento in enumerate(fragmentos)))
+    return padrao, list(rotulos)
+
+def compilar_regras_inutilizacao(regras):
+    """Compila (tag, texto) em <tag>TEXTO</tag> tolerando espaços e pontos finais"""
+    fragmentos = [rf'<{tag}>\s*{_texto_flexivel(texto.rstrip(" ."))}[\s.]*</{tag}>' for tag, texto in regras]
+    return compilar_regras(fragmentos, [texto.rstrip(" .") for _, texto in regras])
+
+def compilar_regras_recusado(regras):
+    """Compila (código, mensagem) em 'CÓDIGO : MENSAGEM' tolerando espaços"""
+    fragmentos = [rf'{re.escape(codigo)}\s*:\s*{_texto_flexivel(mensagem)}' for codigo, mensagem in regras]
+    return compilar_regras(fragmentos, [codigo for codigo, _ in regras])
+
+def buscar_regra(matcher, conteudo):
+    """Varre o conteúdo uma vez e retorna o rótulo da primeira regra encontrada (ou None)"""
+    padrao, rotulos = matcher
+    encontrado = padrao.search(conteudo)
+    if encontrado is None:
+        return None
+    return rotulos[int(encontrado.lastgroup[1:])]
+
+MATCHER_INUTILIZACAO = compilar_regras_inutilizacao(REGRAS_INUTILIZACAO)
+MATCHER_RECUSADO = compilar_regras_recusado(REGRAS_RECUSADO)
+
+# Entra na assinatura do modo incremental: mudar as regras invalida os resultados salvos
+VERSAO_REGRAS = hashlib.sha1(json.dumps([REGRAS_INUTILIZACAO, REGRAS_RECUSADO]).encode('utf-8')).hexdigest()[:8]
+
+def arquivo_recusado_intempestivo(arquivo):
+    """Retorna o código da rejeição de cancelamento intempestivo encontrada no recusado (ou None)"""
+    try:
+        with medir_etapa('leitura_eventos') as contagem:
+            encoding = detectar_encoding(arquivo)
+            with open(arquivo, 'rb') as f:
+                conteudo_bytes = f.read()
+            contagem['itens'], contagem['bytes'] = 1, len(conteudo_bytes)
+            conteudo = conteudo_bytes.decode(encoding)
     except Exception:
         return None
+    
+    # Verificar todas as mensagens numa única varredura
+    return buscar_regra(MATCHER_RECUSADO, conteudo)
+
+def assinatura_eventos(indice_eventos, nfe_num):
+    """Resumo dos arquivos .can/.inu/recusado de uma NF-E; muda quando chega um evento novo"""
+    nfe_str = str(nfe_num).zfill(8)
+    cancelada = f"{nfe_str}.can" in indice_eventos['can']
+    inu = ';'.join(sorted(indice_eventos['inu'].get(nfe_str, ())))
+    recusado = ';'.join(sorted(indice_eventos['recusado'].get(nfe_str, ())))
+    return f"{VERSAO_REGRAS}|{int(cancelada)}|{inu}|{recusado}"
+
+def carregar_resultados_incrementais(conexao, caminhos):
+    """Resultados salvos ainda válidos: arquivo com mesmo tamanho/mtime no índice de cabeçalhos"""
+    anteriores = {}
+    caminhos = list(caminhos)
+    # Lotes para respeitar o limite de parâmetros do SQLite
+    for inicio in range(0, len(caminhos), 500):
+        lote = caminhos[inicio:inicio + 500]
+        marcadores = ','.join('?' * len(lote))
+        for caminho, nnf, assinatura, resultado in conexao.execute(
+                "SELECT c.caminho, c.nnf, r.assinatura_eventos, r.resultado "
+                "FROM cabecalhos_nfe c JOIN resultados_nfe r ON r.caminho = c.caminho "
+                "AND r.tamanho = c.tamanho AND r.mtime_ns = c.mtime_ns "
+                f"WHERE c.caminho IN ({marcadores})", lote):
+            anteriores[caminho] = (nnf, assinatura, resultado)
+    return anteriores
 
-def verificar_cancelamento_intempestivo(caminhos_recusado, nfe_str):
-    """Verifica se há arquivo na pasta recusado e se contém a mensagem de cancelamento intempestivo"""
+def salvar_resultados_incrementais(conexao, caminhos, resultados, indice_eventos):
+    """Grava o resultado de cada XML processado junto com a assinatura dos eventos da nota"""
+    linhas = []
+    for caminho, dados in zip(caminhos, resultados):
+        if dados is False:
+            continue  # Erro de leitura: tentar de novo na próxima execução
+        registro = conexao.execute(
+            "SELECT tamanho, mtime_ns, nnf FROM cabecalhos_nfe WHERE caminho = ?", (caminho,)).fetchone()
+        if registro is None:
+            continue
+        tamanho, mtime_ns, nnf = registro
+        linhas.append((caminho, tamanho, mtime_ns, assinatura_eventos(indice_eventos, nnf),
+                       json.dumps(dados) if dados else None))
+    
+    conexao.executemany("INSERT OR REPLACE INTO resultados_nfe VALUES (?, ?, ?, ?, ?)", linhas)
+    conexao.commit()
+
+def verificar_cancelamento_intempestivo(caminhos_recusado, nfe_str, indice_eventos=None):
+    """Código da rejeição de cancelamento intempestivo da nota na pasta recusado (ou None)"""
+    if indice_eventos is not None:
+        return next((codigo for codigo in (
+            classificar_arquivo_indexado(indice_eventos, arquivo, arquivo_recusado_intempestivo)
+            for arquivo in indice_eventos['recusado'].get(nfe_str, ())) if codigo), None)
+    
     padrao_arquivo = f"*{nfe_str}*.txt"
     
     for caminho_recusado in caminhos_recusado:
@@ -104,43 +747,116 @@ def verificar_cancelamento_intempestivo(caminhos_recusado, nfe_str):
             
         try:
             for arquivo in Path(caminho_recusado).glob(padrao_arquivo):
-                try:
-                    encoding = detectar_encoding(arquivo)
-                    with open(arquivo, 'r', encoding=encoding) as f:
-                        conteudo = f.read()
-                    
-                    # Verificar se contém a mensagem específica
-                    if any(msg in conteudo for msg in [
-                        "501 : Rejeição: Pedido de Cancelamento intempestivo",
-                        "493 : Rejeição: Evento não atende o Schema XML específico", 
-                        "221 : Rejeição: Confirmado o recebimento da NF-e pelo destinatário",
-                        "241 : Rejeição: Um número da faixa já foi utilizado"
-                    ]):
-                        return True
-                except Exception:
-                    continue
+                codigo = arquivo_recusado_intempestivo(arquivo)
+                if codigo:
+                    return codigo
         except Exception:
             continue
     
-    return False
+    return None
 
-def carregar_arquivos_can_rapido(caminhos_eventos):
-    """Carrega lista de arquivos .can de forma rápida"""
-    arquivos_can = set()
-    for caminho_evento in caminhos_eventos:
-        if os.path.exists(caminho_evento):
+def _chaves_nfe_do_nome(nome_arquivo):
+    """Cada sequência de 8 ou 9 dígitos do nome (equivale ao glob *NNNNNNNN*)"""
+    # nNF tem até 9 dígitos: str(nNF).zfill(8) tem 8 ou, a partir de 100000000, 9
+    return {nome_arquivo[i:i + tamanho] for tamanho in (8, 9) for i in range(len(nome_arquivo) - tamanho + 1)
+            if nome_arquivo[i:i + tamanho].isdigit()}
+
+def _indexar_por_nfe(indice, nome_arquivo, caminho_arquivo):
+    """Associa o arquivo a cada sequência de 8 ou 9 dígitos do nome"""
+    for chave in _chaves_nfe_do_nome(nome_arquivo):
+        indice.setdefault(chave, []).append(caminho_arquivo)
+
+def _listar_diretorio(caminho):
+    """os.listdir que devolve None se o diretório não existir (roda numa thread)"""
+    if not os.path.exists(caminho):
+        return None
+    return os.listdir(caminho)
+
+def _listar_xmls(caminho_xml):
+    """Lista os .xml do diretório já com o stat em cache no DirEntry (roda numa thread)"""
+    with medir_etapa('listagem_xml') as contagem:
+        with os.scandir(caminho_xml) as entries:
+            arquivos_lista = [entry for entry in entries if entry.is_file() and entry.name.lower().endswith('.xml')]
+        for entry in arquivos_lista:
+            try:
+                entry.stat()
+            except OSError:
+                pass
+        contagem['itens'] = len(arquivos_lista)
+    return arquivos_lista
+
+def carregar_indice_eventos(caminhos_eventos, caminhos_recusado, threads=THREADS_LISTAGEM):
+    """Lista eventos e recusado uma única vez (em paralelo): .can, .inu e .txt indexados por NF-E"""
+    indice_eventos = {
+        'can': set(),       # nomes dos arquivos .can (minúsculos)
+        'inu': {},          # NF-E (8 dígitos) -> arquivos .inu
+        'recusado': {},     # NF-E (8 dígitos) -> arquivos .txt do recusado
+        'status': {},       # arquivo -> classificação já calculada
+    }
+    
+    pastas = [('eventos', c) for c in caminhos_eventos] + [('recusado', c) for c in caminhos_recusado]
+    if not pastas:
+        return indice_eventos
+    
+    with medir_etapa('listagem_eventos') as contagem, ThreadPoolExecutor(max_workers=max(1, min(threads, len(pastas)))) as executor:
+        listagens = [executor.submit(_listar_diretorio, caminho) for _, caminho in pastas]
+        
+        for (tipo, caminho), listagem in zip(pastas, listagens):
             try:
-                # Listar arquivos .can uma única vez
-                for arquivo in os.listdir(caminho_evento):
-                    if arquivo.lower().endswith('.can'):
-                        arquivos_can.add(arquivo.lower())
+                arquivos = listagem.result()
             except Exception as e:
-                print(f"⚠️ Erro ao acessar eventos {caminho_evento}: {e}")
-    return arquivos_can
+                print(f"⚠️ Erro ao acessar {tipo} {caminho}: {e}")
+                continue
+            if arquivos is None:
+                continue
+            
+            contagem['itens'] += len(arquivos)
+            for arquivo in arquivos:
+                nome = arquivo.lower()
+                if tipo == 'recusado':
+                    if nome.endswith('.txt'):
+                        _indexar_por_nfe(indice_eventos['recusado'], arquivo, os.path.join(caminho, arquivo))
+                elif nome.endswith('.can'):
+                    indice_eventos['can'].add(nome)
+                elif nome.endswith('.inu'):
+                    _indexar_por_nfe(indice_eventos['inu'], arquivo, os.path.join(caminho, arquivo))
+    
+    return indice_eventos
+
+def classificar_arquivo_indexado(indice_eventos, arquivo, classificador):
+    """Classifica o arquivo uma única vez por execução e guarda o resultado no índice"""
+    if arquivo not in indice_eventos['status']:
+        indice_eventos['status'][arquivo] = classificador(arquivo)
+    return indice_eventos['status'][arquivo]
+
+def carregar_arquivos_can_rapido(caminhos_eventos):
+    """Carrega lista de arquivos .can de forma rápida"""
+    return carregar_indice_eventos(caminhos_eventos, [])['can']
+
+def arquivo_inu_nao_autorizado(arquivo):
+    """Retorna a justificativa de inutilização encontrada no arquivo .inu (ou None)"""
+    try:
+        with medir_etapa('leitura_eventos') as contagem:
+            encoding = detectar_encoding(arquivo)
+            with open(arquivo, 'rb') as f:
+                conteudo_bytes = f.read()
+            contagem['itens'], contagem['bytes'] = 1, len(conteudo_bytes)
+            conteudo = conteudo_bytes.decode(encoding)
+    except Exception:
+        return None
+    
+    # Verificar todas as justificativas numa única varredura
+    return buscar_regra(MATCHER_INUTILIZACAO, conteudo)
 
-def verificar_inutilizacao_nota_nao_autorizada(caminhos_eventos, nfe_num):
-    """Verifica se há arquivo .inu com NOTA NAO AUTORIZADA para a nota fiscal"""
+def verificar_inutilizacao_nota_nao_autorizada(caminhos_eventos, nfe_num, indice_eventos=None):
+    """Justificativa do .inu com NOTA NAO AUTORIZADA para a nota fiscal (ou None)"""
     nfe_str = str(nfe_num).zfill(8)
+    
+    if indice_eventos is not None:
+        return next((justificativa for justificativa in (
+            classificar_arquivo_indexado(indice_eventos, arquivo, arquivo_inu_nao_autorizado)
+            for arquivo in indice_eventos['inu'].get(nfe_str, ())) if justificativa), None)
+    
     padrao_arquivo = f"*{nfe_str}*.inu"
     
     for caminho_evento in caminhos_eventos:
@@ -149,342 +865,1124 @@ def verificar_inutilizacao_nota_nao_autorizada(caminhos_eventos, nfe_num):
             
         try:
             for arquivo in Path(caminho_evento).glob(padrao_arquivo):
-                try:
-                    encoding = detectar_encoding(arquivo)
-                    with open(arquivo, 'r', encoding=encoding) as f:
-                        conteudo = f.read()
-                    
-                    # Verificar se contém a mensagem específica
-                    if '<xJust>NOTA NAO AUTORIZADA</xJust>' in conteudo:
-                        return True
-                    if '<xJust>NOTA NAO APARECE NO SEFAZ</xJust>' in conteudo:
-                        return True
-                    if '<xServ>INUTILIZAR</xServ>' in conteudo:
-                        return True
-                    if '<xJust>ERRO NO SEFAZ................</xJust>' in conteudo:
-                        return True
-                    if '<xJust>MERCADO NAO QUIS RECEBER</xJust>' in conteudo:
-                        return True
-                    if '<xJust>MERCADORIA FOI DUAS VEZES NO DIA</xJust>' in conteudo:
-                        return True
-                    if '<xJust>ERRO NA PESAGEM</xJust>' in conteudo:
-                        return True
-                    if '<xJust>NAO APARECE NO SEFAZ....</xJust>' in conteudo:
-                        return True
-                    if '<xJust>IMPOSTO ERRADO......</xJust>' in conteudo:
-                        return True
-                    if '<xJust>IMPOSTO ERRADO.....</xJust>' in conteudo:
-                        return True
-                    if '<xJust>IMPOSTO ERRADO............</xJust>' in conteudo:
-                        return True
-                    if '<xJust>IMPOSTO ERRADO.....</xJust>' in conteudo:
-                        return True
-                    if '<xJust>IMPOSTO ERRADO.....</xJust>' in conteudo:
-                        return True
-                    if '<xJust>FORA DE HORARIO....</xJust>' in conteudo:
-                        return True
-                    if '<xJust>NAO APARECEU NO SEFAZ</xJust>' in conteudo:
-                        return True
-                    if '<xJust>ERRO NO SEFAZ..............</xJust>' in conteudo:
-                        return True
-                    if '<xJust>ERRO NO SEFAZ............</xJust>' in conteudo:
-                        return True
-                    if '<xJust>CARRO QUEBROU.........</xJust>' in conteudo:
-                        return True
-                    if '<xJust>CARRO QUEBROU..........</xJust>' in conteudo:
-                        return True
-                    if '<xJust>CARRO QUEBROU...........</xJust>' in conteudo:
-                        return True
-                except Exception:
-                    continue
+                justificativa = arquivo_inu_nao_autorizado(arquivo)
+                if justificativa:
+                    return justificativa
         except Exception:
             continue
     
-    return False
+    return None
+
+def normalizar_bytes_xml(conteudo):
+    """XML UTF-16/32 (raro) convertido para UTF-8, com a declaração ajustada; os demais voltam como estão"""
+    if conteudo.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        texto = conteudo.decode(resolver_encoding(conteudo))
+        conteudo = PADRAO_DECLARACAO_XML.sub(b'<?xml version="1.0" encoding="utf-8"', texto.encode('utf-8'), count=1)
+    return conteudo
+
+def extrair_campos_nfe(conteudo):
+    """Extrai cNF, nNF, vNF e dhEmi direto dos bytes (primeira ocorrência); None se faltar algum"""
+    campos = {}
+    for campo, padrao in PADROES_CAMPOS_NFE.items():
+        encontrado = padrao.search(conteudo)
+        if encontrado is None:
+            return None
+        # Elemento vazio (<tag/> ou <tag></tag>) tem text None no ElementTree
+        texto = encontrado.group(1)
+        campos[campo] = texto.decode('utf-8', errors='replace') if texto else None
+    return campos
 
-def processar_xml_completo(caminho_completo, arquivos_can, caminhos_recusado, caminhos_eventos):
-    """Processa um arquivo XML completo e retorna os dados"""
+def _decimal_xml(texto):
+    """Número do XML (ponto decimal, sem milhar) em float; vazio ou inválido vira 0.0"""
     try:
-        encoding = detectar_encoding(caminho_completo)
-        with open(caminho_completo, 'r', encoding=encoding) as file:
-            conteudo = file.read()
-        
-        # Verificar se é nota de venda RAPIDAMENTE
-        if '<natOp>VENDA</natOp>' not in conteudo:
+        return float(texto) if texto else 0.0
+    except ValueError:
+        return 0.0
+
+def extrair_itens_nfe(conteudo):
+    """Extrai (cProd, qCom, vUnCom, vProd) de cada item da nota direto dos bytes, sem montar a árvore"""
+    itens = []
+    for bloco in PADRAO_PROD_NFE.finditer(conteudo):
+        valores = []
+        for campo, padrao in PADROES_ITEM_NFE.items():
+            encontrado = padrao.search(bloco.group(1))
+            valores.append(encontrado.group(1).decode('utf-8', errors='replace').strip()
+                           if encontrado and encontrado.group(1) else None)
+        codigo, quantidade, preco, valor = valores
+        itens.append((codigo or '', _decimal_xml(quantidade), _decimal_xml(preco), _decimal_xml(valor)))
+    return itens
+
+def extrair_campos_nfe_arvore(conteudo):
+    """Versão original: parse completo e remoção de namespaces (usada para conferência)"""
+    root = ler_xml_de_bytes(conteudo)
+    
+    # Remover namespaces
+    for elem in root.iter():
+        if '}' in elem.tag:
+            elem.tag = elem.tag.split('}', 1)[1]
+    
+    campos = {}
+    for campo in PADROES_CAMPOS_NFE:
+        elemento = root.find(f'.//{campo}')
+        if elemento is None:
             return None
+        campos[campo] = elemento.text
+    return campos
+
+def verificar_extrator_xml(diretorios):
+    """Confere, XML a XML, se o extrator por bytes devolve o mesmo que o parse completo"""
+    total = 0
+    divergentes = 0
+    for diretorio in diretorios:
+        for caminho in sorted(Path(diretorio).glob('*.xml')):
+            with open(caminho, 'rb') as f:
+                conteudo = normalizar_bytes_xml(f.read())
+            total += 1
+            try:
+                esperado = extrair_campos_nfe_arvore(conteudo)
+            except ET.ParseError as e:
+                print(f"⚠️ {caminho.name}: XML inválido ({e}), ignorado na conferência")
+                continue
+            obtido = extrair_campos_nfe(conteudo)
+            if obtido != esperado:
+                divergentes += 1
+                print(f"❌ {caminho.name}: árvore={esperado} bytes={obtido}")
+    
+    print(f"{'✅' if divergentes == 0 else '❌'} Extrator conferido em {total} XMLs: {divergentes} divergências")
+    return divergentes == 0
+
+def processar_xml_completo(caminho_completo, arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos=None,
+                           itens=False):
+    """Processa um XML completo: dict da nota, None se descartada ou False se houve erro na leitura"""
+    try:
+        with medir_etapa('leitura_xml') as contagem:
+            with open(caminho_completo, 'rb') as file:
+                conteudo = file.read()
+            contagem['itens'], contagem['bytes'] = 1, len(conteudo)
         
-        root = ET.fromstring(conteudo)
+        # UTF-16/32 (raro): converter para UTF-8 para a verificação em bytes abaixo
+        conteudo = normalizar_bytes_xml(conteudo)
         
-        # Remover namespaces
-        for elem in root.iter():
-            if '}' in elem.tag:
-                elem.tag = elem.tag.split('}', 1)[1]
+        # Verificar se é nota de venda RAPIDAMENTE (com ou sem prefixo, como no índice)
+        nat_op = PADROES_CABECALHO_NFE['natOp'].search(conteudo)
+        if nat_op is None or nat_op.group(1) != b'VENDA':
+            return None
         
-        # Buscar elementos necessários
-        cnf_element = root.find('.//cNF')
-        nnf_element = root.find('.//nNF')
-        vnf_element = root.find('.//vNF')
-        dh_emi_element = root.find('.//dhEmi')
+        # Buscar elementos necessários (sem montar a árvore)
+        campos = extrair_campos_nfe(conteudo)
         
-        if all([cnf_element is not None, nnf_element is not None, 
-               vnf_element is not None, dh_emi_element is not None]):
+        if campos is not None:
             
-            nfe_num = int(nnf_element.text) if nnf_element.text else 0
+            nfe_num = int(campos['nNF']) if campos['nNF'] else 0
             nfe_str = str(nfe_num).zfill(8)
             nome_can = f"{nfe_str}.can"
             
             # PRIMEIRO: Verificar se a nota foi inutilizada com "NOTA NAO AUTORIZADA"
-            if verificar_inutilizacao_nota_nao_autorizada(caminhos_eventos, nfe_num):
-                print(f"⚠️ Nota {nfe_num} inutilizada (NÃO AUTORIZADA) - removendo da lista")
+            with medir_etapa('verificacao_eventos'):
+                justificativa = verificar_inutilizacao_nota_nao_autorizada(caminhos_eventos, nfe_num, indice_eventos)
+            if justificativa:
+                print(f"⚠️ Nota {nfe_num} inutilizada ({justificativa}) - removendo da lista")
                 return None
             
             # SEGUNDO: Verificar se existe arquivo .can
             if nome_can.lower() in arquivos_can:
                 # Verificar se há cancelamento intempestivo
-                if verificar_cancelamento_intempestivo(caminhos_recusado, nfe_str):
-                    return {
+                with medir_etapa('verificacao_eventos'):
+                    codigo_rejeicao = verificar_cancelamento_intempestivo(caminhos_recusado, nfe_str, indice_eventos)
+                if codigo_rejeicao:
+                    nota = {
                         'CF': 'VENDA',
-                        'Romaneio': int(cnf_element.text) if cnf_element.text else 0,
+                        'Romaneio': int(campos['cNF']) if campos['cNF'] else 0,
                         'NF-E': nfe_num,
-                        'Valor XML': float(vnf_element.text) if vnf_element.text else 0.0,
-                        'DATA': formatar_data(dh_emi_element.text),
-                        'OBS': 'Cancelamento Intempestivo'
+                        'Centavos XML': centavos_xml(campos['vNF']) if campos['vNF'] else 0,
+                        'DATA': formatar_data(campos['dhEmi']),
+                        'OBS': f'Cancelamento Intempestivo ({codigo_rejeicao})'
                     }
                 else:
                     return None  # Nota cancelada normalmente
             else:
                 # Nota não cancelada
-                return {
+                nota = {
                     'CF': 'VENDA',
-                    'Romaneio': int(cnf_element.text) if cnf_element.text else 0,
+                    'Romaneio': int(campos['cNF']) if campos['cNF'] else 0,
                     'NF-E': nfe_num,
-                    'Valor XML': float(vnf_element.text) if vnf_element.text else 0.0,
-                    'DATA': formatar_data(dh_emi_element.text)
+                    'Centavos XML': centavos_xml(campos['vNF']) if campos['vNF'] else 0,
+                    'DATA': formatar_data(campos['dhEmi'])
                 }
+            
+            if itens:
+                nota['_itens'] = extrair_itens_nfe(conteudo)
+            return nota
+    
+    except Exception as e:
+        print(f"⚠️ Erro ao processar {os.path.basename(caminho_completo)}: {e}")
+        return False
+    
+    return None
+
+def _inicializar_worker_xml(arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos, itens=False):
+    """Guarda no processo worker os dados usados por todos os XMLs"""
+    global _contexto_worker_xml
+    _contexto_worker_xml = (arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos, itens)
+
+def _processar_xml_cronometrado(caminho, arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos, tempos,
+                                itens=False):
+    """processar_xml_completo guardando (segundos, caminho) em tempos para o relatório"""
+    inicio = time.perf_counter()
+    resultado = processar_xml_completo(caminho, arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos,
+                                       itens)
+    tempos.append((time.perf_counter() - inicio, caminho))
+    return resultado
+
+def _processar_lote_xml(caminhos):
+    """Processa um lote de XMLs dentro do worker; devolve também as métricas do lote"""
+    arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos, itens = _contexto_worker_xml
+    iniciar_metricas()
+    tempos = []
+    resultados = [_processar_xml_cronometrado(caminho, arquivos_can, caminhos_recusado, caminhos_eventos,
+                                              indice_eventos, tempos, itens)
+                  for caminho in caminhos]
+    registrar_arquivos_lentos(tempos)
+    return resultados, {'etapas': _metricas['etapas'], 'arquivos_lentos': _metricas['arquivos_lentos']}
+
+def processar_xmls_em_paralelo(arquivos, arquivos_can, caminhos_recusado, caminhos_eventos,
+                               workers, tamanho_lote=TAMANHO_LOTE_XML, indice_eventos=None, itens=False,
+                               ao_processar=None):
+    """Processa os XMLs em um pool de processos, mantendo a ordem de entrada (lotes em ao_processar, se dado)"""
+    lotes = [arquivos[i:i + tamanho_lote] for i in range(0, len(arquivos), tamanho_lote)]
+    resultados = []
+    processados = 0
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_inicializar_worker_xml,
+                             initargs=(arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos,
+                                       itens)) as executor:
+        # executor.map devolve os lotes na ordem de envio
+        for resultado_lote, metricas_lote in executor.map(_processar_lote_xml, lotes):
+            mesclar_metricas(metricas_lote)
+            processados += len(resultado_lote)
+            if ao_processar is None:
+                resultados.extend(resultado_lote)
+            else:
+                ao_processar(resultado_lote)
+            print(f"📦 Processados {processados}/{len(arquivos)} arquivos...")
+
+    return resultados
+
+def resolver_workers(workers):
+    """Converte o número de workers pedido (0 ou negativo = todos os núcleos)"""
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+def processar_arquivos_xml(arquivos, arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos, workers,
+                           itens=False, ao_processar=None):
+    """Processa a lista de XMLs (em série ou em paralelo); resultados na mesma ordem da lista
+    
+    Com ao_processar, os resultados vão para a função em lotes (na ordem) em vez de voltarem numa lista.
+    """
+    with medir_etapa('processamento_xml') as contagem:
+        contagem['itens'] = len(arquivos)
+        
+        if workers > 1 and len(arquivos) > TAMANHO_LOTE_XML:
+            print(f"⏳ Processando arquivos em paralelo ({workers} processos)...")
+            return processar_xmls_em_paralelo(arquivos, arquivos_can, caminhos_recusado, caminhos_eventos,
+                                              workers, indice_eventos=indice_eventos, itens=itens,
+                                              ao_processar=ao_processar)
+        
+        print("⏳ Processando arquivos...")
+        resultados = []
+        tempos = []
+        for i, caminho_completo in enumerate(arquivos, 1):
+            if i % 50 == 0:  # Progresso a cada 50 arquivos
+                print(f"📦 Processados {i}/{len(arquivos)} arquivos...")
+            
+            resultados.append(_processar_xml_cronometrado(caminho_completo, arquivos_can, caminhos_recusado,
+                                                          caminhos_eventos, indice_eventos, tempos, itens))
+            if ao_processar is not None and (len(resultados) == TAMANHO_LOTE_XML or i == len(arquivos)):
+                ao_processar(resultados)
+                resultados = []
+        registrar_arquivos_lentos(tempos)
+        return resultados
+
+def montar_caminhos_nfe(raizes):
+    """Pastas de XML (raízes e depois enviado, ordem de precedência), eventos e recusado"""
+    caminhos_xml = list(raizes) + [os.path.join(raiz, "enviado") for raiz in raizes]
+    caminhos_eventos = [os.path.join(raiz, "eventos") for raiz in raizes]
+    caminhos_recusado = [os.path.join(raiz, "recusado") for raiz in raizes]
+    return caminhos_xml, caminhos_eventos, caminhos_recusado
+
+def _nota_repetida(notas_unicas, chave, caminho_completo, duplicatas):
+    """True se a nota já foi vista; o par (descartado, mantido) vai para duplicatas"""
+    mantido = notas_unicas.get(chave)
+    if mantido is None:
+        notas_unicas[chave] = caminho_completo
+        return False
+    duplicatas.append((caminho_completo, mantido))
+    return True
+
+COLUNAS_ACUMULADOR_NOTAS = ['cf', 'romaneio', 'nfe', 'centavos', 'data', 'emissao', 'obs']
+ORDINAL_EPOCH = datetime(1970, 1, 1).toordinal()
+
+def criar_acumulador_notas(capacidade=1024):
+    """Colunas numpy tipadas das notas processadas, preenchidas por acumular_notas"""
+    capacidade = max(1, capacidade)
+    return {
+        'tamanho': 0,
+        'total': 0,
+        'categorias_cf': {},
+        'categorias_obs': {},
+        'cf': np.empty(capacidade, dtype=np.int16),
+        'romaneio': np.empty(capacidade, dtype=np.int32),
+        'nfe': np.empty(capacidade, dtype=np.int32),
+        'centavos': np.empty(capacidade, dtype=np.int64),
+        'data': np.empty(capacidade, dtype='U16'),
+        'emissao': np.empty(capacidade, dtype='datetime64[D]'),
+        'obs': np.empty(capacidade, dtype=np.int16),
+    }
+
+def acumular_notas(acumulador, notas, datas_emissao):
+    """Grava um lote de notas nas próximas posições do acumulador, uma fatia por coluna"""
+    inicio = acumulador['tamanho']
+    fim = inicio + len(notas)
+    if fim > len(acumulador['nfe']):
+        # Capacidade ao menos dobrada: cópia amortizada, como numa lista
+        capacidade = max(fim, 2 * len(acumulador['nfe']))
+        for coluna in COLUNAS_ACUMULADOR_NOTAS:
+            anterior = acumulador[coluna]
+            acumulador[coluna] = np.empty(capacidade, dtype=anterior.dtype)
+            acumulador[coluna][:inicio] = anterior[:inicio]
+    
+    lote = slice(inicio, fim)
+    categorias_cf, categorias_obs = acumulador['categorias_cf'], acumulador['categorias_obs']
+    acumulador['cf'][lote] = [categorias_cf.setdefault(nota['CF'], len(categorias_cf)) for nota in notas]
+    acumulador['romaneio'][lote] = [nota['Romaneio'] for nota in notas]
+    acumulador['nfe'][lote] = [nota['NF-E'] for nota in notas]
+    centavos = [nota['Centavos XML'] for nota in notas]
+    acumulador['centavos'][lote] = centavos
+    acumulador['data'][lote] = [nota['DATA'] for nota in notas]
+    # date -> dias desde 1970 (conversão direta de date para datetime64 é lenta)
+    dias = np.array([data.toordinal() for data in datas_emissao], dtype=np.int64) - ORDINAL_EPOCH
+    acumulador['emissao'][lote] = dias.view('datetime64[D]')
+    acumulador['obs'][lote] = [-1 if nota.get('OBS') is None
+                               else categorias_obs.setdefault(nota['OBS'], len(categorias_obs))
+                               for nota in notas]
+    acumulador['total'] += sum(centavos)
+    acumulador['tamanho'] = fim
+
+def df_acumulador_notas(acumulador):
+    """DataFrame das notas sobre as colunas do acumulador (Valor XML em reais, DATA em datetime64)"""
+    tamanho = acumulador['tamanho']
+    colunas = {
+        'CF': pd.Categorical.from_codes(acumulador['cf'][:tamanho], categories=list(acumulador['categorias_cf'])),
+        'Romaneio': acumulador['romaneio'][:tamanho],
+        'NF-E': acumulador['nfe'][:tamanho],
+        'Valor XML': acumulador['centavos'][:tamanho] / 100,
+        'DATA': pd.to_datetime(acumulador['data'][:tamanho], format=FORMATO_DATA_NOTA, errors='coerce'),
+    }
+    if acumulador['categorias_obs']:
+        colunas['OBS'] = pd.Categorical.from_codes(acumulador['obs'][:tamanho],
+                                                   categories=list(acumulador['categorias_obs']))
+    return pd.DataFrame(colunas, copy=False)
+
+def _coletar_notas_periodos(periodos, caminho_indice, workers, incremental, threads_listagem, raizes, resumo,
+                            itens=False, estado=None):
+    """Varre as pastas uma vez e processa os XMLs dos períodos: (acumulador, itens) ou None"""
+    # Duplicatas: vale a primeira chave na ordem de montar_caminhos_nfe. estado (dict) guarda o
+    # que o modo observação mantém em memória: índice de eventos, candidatos e resultado de cada XML
+    # Lista de caminhos - INCLUINDO PASTAS ENVIADO
+    caminhos_xml, caminhos_eventos, caminhos_recusado = montar_caminhos_nfe(raizes or RAIZES_NFE)
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, threads_listagem))
+    
+    # Verificar diretórios
+    diretorios_existentes = [c for c, existe in zip(caminhos_xml, executor.map(os.path.exists, caminhos_xml)) if existe]
+    if not diretorios_existentes:
+        print("❌ Nenhum diretório encontrado!")
+        resumo['erro'] = "nenhum diretório encontrado"
+        executor.shutdown()
+        return None
+    
+    # Uma única varredura cobre todos os períodos: do menor início ao maior fim
+    data_inicial = min(inicio for inicio, _ in periodos)
+    data_final = max(fim for _, fim in periodos)
+    
+    def no_periodo(data_emissao):
+        return any(inicio <= data_emissao <= fim for inicio, fim in periodos)
+    
+    # Disparar todas as listagens de uma vez; eventos e recusado são montados em segundo plano
+    print("⏳ Carregando arquivos .can, .inu e recusado...")
+    futuro_eventos = executor.submit(carregar_indice_eventos, caminhos_eventos, caminhos_recusado, threads_listagem)
+    listagens_xml = {caminho_xml: executor.submit(_listar_xmls, caminho_xml) for caminho_xml in diretorios_existentes}
+    
+    print("⏳ Buscando arquivos XML no período...")
+    
+    total_arquivos = 0
+    arquivos_no_periodo = 0
+    notas_inutilizadas = 0
+    
+    # PRIMEIRO: Buscar RAPIDAMENTE arquivos no período
+    arquivos_para_processar = []
+    datas_para_processar = []  # dhEmi de cada arquivo, para separar as notas por período
+    notas_unicas = {}  # chave da nota -> caminho mantido (EVITA DUPLICATAS)
+    duplicatas = []  # (caminho descartado, caminho mantido)
+    arquivos_sem_data = set()  # XMLs sem dhEmi: ficariam de fora sem aviso (com índice, só os lidos agora)
+    candidatos = {caminho_xml: {} for caminho_xml in diretorios_existentes}  # pasta -> {caminho: (data, chave)}
+    sem_venda = []  # descartados pelo índice (natOp diferente de VENDA)
+    
+    conexao_indice = None
+    if caminho_indice:
+        try:
+            conexao_indice = abrir_indice_nfe(caminho_indice)
+        except Exception as e:
+            print(f"⚠️ Índice indisponível ({e}), lendo cabeçalhos diretamente")
+    
+    # As pastas são consumidas na ordem de caminhos_xml para manter a regra de duplicatas
+    inicio_varredura = time.perf_counter()
+    for caminho_xml in diretorios_existentes:
+        print(f"🔍 Escaneando {caminho_xml}...")
+        
+        try:
+            # Listagem já disparada em paralelo; espera só pela desta pasta
+            arquivos_lista = listagens_xml[caminho_xml].result()
+            
+            total_arquivos += len(arquivos_lista)
+            
+            if conexao_indice is not None:
+                # Atualizar índice apenas com arquivos novos/alterados e consultar o período
+                novos = atualizar_indice_diretorio(conexao_indice, caminho_xml, arquivos_lista, executor,
+                                                   arquivos_sem_data)
+                if novos:
+                    print(f"🗂️ {novos} arquivos novos/alterados indexados")
+                
+                for nome, caminho_completo, nat_op, data_emissao, chave in consultar_indice_periodo(
+                        conexao_indice, caminho_xml, data_inicial, data_final):
+                    data_emissao = datetime.strptime(data_emissao, "%Y-%m-%d").date()
+                    if not no_periodo(data_emissao):
+                        continue  # Entre dois períodos
+                    candidatos[caminho_xml][caminho_completo] = (data_emissao, chave or nome)
+                    if _nota_repetida(notas_unicas, chave or nome, caminho_completo, duplicatas):
+                        continue  # PULAR NOTA DUPLICADA
+                    arquivos_no_periodo += 1
+                    # Notas que não são de venda já são descartadas pelo índice
+                    if nat_op == 'VENDA':
+                        arquivos_para_processar.append(caminho_completo)
+                        datas_para_processar.append(data_emissao)
+                    else:
+                        sem_venda.append(caminho_completo)
+                continue
+            
+            caminhos_candidatos = [os.path.join(caminho_xml, entry.name) for entry in arquivos_lista]
+            
+            # Verificar data e chave de cada arquivo (RÁPIDO, uma leitura) - em paralelo, na ordem da listagem
+            for entry, caminho_completo, (data_emissao, chave) in zip(
+                    arquivos_lista, caminhos_candidatos,
+                    executor.map(extrair_data_e_chave_rapido_xml, caminhos_candidatos)):
+                if data_emissao is None:
+                    arquivos_sem_data.add(entry.name)
+                elif no_periodo(data_emissao):
+                    candidatos[caminho_xml][caminho_completo] = (data_emissao, chave or entry.name)
+                    if not _nota_repetida(notas_unicas, chave or entry.name, caminho_completo, duplicatas):
+                        arquivos_para_processar.append(caminho_completo)
+                        datas_para_processar.append(data_emissao)
+                        arquivos_no_periodo += 1
+                    
+        except Exception as e:
+            print(f"⚠️ Erro em {caminho_xml}: {e}")
+    
+    # Parede da listagem + pré-filtro por data (as leituras em threads aparecem em leitura_cabecalhos)
+    registrar_etapa('varredura_pre_filtro', time.perf_counter() - inicio_varredura, total_arquivos)
+    
+    with medir_etapa('espera_eventos'):
+        indice_eventos = futuro_eventos.result()
+    executor.shutdown()
+    arquivos_can = indice_eventos['can']
+    print(f"📄 {len(arquivos_can)} arquivos .can carregados")
+    
+    print(f"📊 Total de arquivos XML encontrados: {total_arquivos}")
+    print(f"📅 Arquivos únicos no período: {arquivos_no_periodo}")
+    resumo['arquivos_encontrados'] = total_arquivos
+    resumo['arquivos_no_periodo'] = arquivos_no_periodo
+    
+    if duplicatas:
+        print(f"♊ {len(duplicatas)} XMLs duplicados (mesma nota) ignorados - vale a raiz antes de enviado:")
+        for descartado, mantido in duplicatas[:QTD_DUPLICATAS_LISTADAS]:
+            print(f"   {descartado} (mantido {mantido})")
+        if len(duplicatas) > QTD_DUPLICATAS_LISTADAS:
+            print("   ...")
+    resumo['duplicatas'] = len(duplicatas)
+    
+    arquivos_sem_data -= {os.path.basename(caminho) for caminho in notas_unicas.values()}  # cópia com data em outra pasta
+    if arquivos_sem_data:
+        listados = sorted(arquivos_sem_data)[:QTD_ARQUIVOS_SEM_DATA_LISTADOS]
+        print(f"⚠️ {len(arquivos_sem_data)} XMLs sem dhEmi (fora do filtro por data): {', '.join(listados)}"
+              + (" ..." if len(arquivos_sem_data) > len(listados) else ""))
+    resumo['arquivos_sem_data'] = len(arquivos_sem_data)
+    
+    if estado is not None:
+        estado.update({
+            'periodos': periodos,
+            'itens': itens,
+            'caminhos_xml': caminhos_xml,
+            'caminhos_eventos': caminhos_eventos,
+            'caminhos_recusado': caminhos_recusado,
+            'indice_eventos': indice_eventos,
+            'candidatos': {caminho_xml: candidatos.get(caminho_xml, {}) for caminho_xml in caminhos_xml},
+            'resultados': dict.fromkeys(sem_venda),
+            'nnf': {},
+        })
+    
+    if arquivos_no_periodo == 0:
+        print("❌ Nenhum arquivo no período especificado.")
+        if conexao_indice is not None:
+            conexao_indice.close()
+        return None
+    
+    # SEGUNDO: Processar APENAS os arquivos do período
+    workers = resolver_workers(workers)
+    
+    if incremental and conexao_indice is None:
+        print("⚠️ Modo incremental requer o índice - processando todos os arquivos")
+        incremental = False
+    
+    reaproveitados = {}  # posição em arquivos_para_processar -> resultado salvo
+    pendentes = list(range(len(arquivos_para_processar)))
+    
+    if incremental:
+        # Reaproveitar notas cujo XML e eventos não mudaram desde a última execução
+        anteriores = carregar_resultados_incrementais(conexao_indice, arquivos_para_processar)
+        pendentes = []
+        for posicao, caminho_completo in enumerate(arquivos_para_processar):
+            anterior = anteriores.get(caminho_completo)
+            if anterior is not None and anterior[1] == assinatura_eventos(indice_eventos, anterior[0]):
+                dados = json.loads(anterior[2]) if anterior[2] else None
+                # Resultado salvo sem os itens (execução sem --itens) ou com o valor em float
+                # (versões anteriores): a nota é lida de novo
+                if dados and ('Centavos XML' not in dados or (itens and '_itens' not in dados)):
+                    pendentes.append(posicao)
+                    continue
+                reaproveitados[posicao] = dados
+            else:
+                pendentes.append(posicao)
+        print(f"♻️ {len(arquivos_para_processar) - len(pendentes)} notas reaproveitadas da execução anterior, "
+              f"{len(pendentes)} a processar")
+    
+    # Cada lote processado vai direto para o acumulador, na ordem dos arquivos (com as reaproveitadas
+    # entre eles), e os dicts do lote são descartados em seguida
+    notas = criar_acumulador_notas()
+    itens_nfe = [] if itens else None
+    arquivos_pendentes = [arquivos_para_processar[posicao] for posicao in pendentes]
+    acumulados = {'arquivos': 0, 'pendentes': 0}
+    
+    def acumular_ate(fim, novos):
+        inicio = acumulados['arquivos']
+        lote = [novos[posicao] if posicao in novos else reaproveitados.pop(posicao) for posicao in range(inicio, fim)]
+        if estado is not None:
+            # Erro de leitura (False) fica de fora: o XML é lido de novo na próxima atualização
+            estado['resultados'].update((caminho, dados) for caminho, dados
+                                        in zip(arquivos_para_processar[inicio:fim], lote) if dados is not False)
+        _acumular_lote(notas, itens_nfe, datas_para_processar[inicio:fim], lote)
+        acumulados['arquivos'] = fim
+    
+    def ao_processar(resultados_lote):
+        inicio = acumulados['pendentes']
+        fim = inicio + len(resultados_lote)
+        acumulados['pendentes'] = fim
+        if incremental:
+            salvar_resultados_incrementais(conexao_indice, arquivos_pendentes[inicio:fim], resultados_lote,
+                                           indice_eventos)
+        acumular_ate(pendentes[fim - 1] + 1, dict(zip(pendentes[inicio:fim], resultados_lote)))
+    
+    processar_arquivos_xml(arquivos_pendentes, arquivos_can, caminhos_recusado, caminhos_eventos, indice_eventos,
+                           workers, itens, ao_processar=ao_processar)
+    acumular_ate(len(arquivos_para_processar), {})  # reaproveitadas depois do último XML processado
+    
+    if conexao_indice is not None:
+        conexao_indice.close()
+    
+    df_itens = montar_df_itens(itens_nfe) if itens else None
+    notas_processadas = notas['tamanho']
+    
+    print(f"\n📊 RESUMO FINAL:")
+    print(f"📄 Arquivos únicos no período: {arquivos_no_periodo}")
+    print(f"✅ Notas processadas: {notas_processadas}")
+    print(f"🚫 Notas inutilizadas (NÃO AUTORIZADA): {notas_inutilizadas}")
+    print(f"💰 Valor total: R$ {notas['total'] / 100:,.2f}")
+    resumo['notas_processadas'] = notas_processadas
+    resumo['valor_total'] = notas['total'] / 100
+    
+    if itens:
+        print(f"📦 Itens das notas: {len(df_itens)}")
+        resumo['itens'] = len(df_itens)
+    
+    return notas, df_itens
+
+def _acumular_lote(notas, itens_nfe, datas_emissao, resultados):
+    """Grava no acumulador as notas válidas de um lote (XMLs sem nota ficam de fora); itens em itens_nfe"""
+    lote, datas_lote = [], []
+    for data_emissao, dados in zip(datas_emissao, resultados):
+        if dados:
+            if itens_nfe is not None:
+                itens_nfe.extend((dados['NF-E'], *item) for item in dados.get('_itens') or ())
+            lote.append(dados)
+            datas_lote.append(data_emissao)
+    if lote:
+        acumular_notas(notas, lote, datas_lote)
+
+def _acumular_resultados(datas_emissao, resultados, itens):
+    """Acumulador das notas válidas, lote a lote, e, com itens, o DataFrame dos itens"""
+    notas = criar_acumulador_notas()
+    itens_nfe = [] if itens else None
+    for inicio in range(0, len(resultados), TAMANHO_LOTE_XML):
+        fim = inicio + TAMANHO_LOTE_XML
+        _acumular_lote(notas, itens_nfe, datas_emissao[inicio:fim], resultados[inicio:fim])
+    return notas, montar_df_itens(itens_nfe) if itens else None
+
+def montar_df_itens(itens_nfe):
+    """DataFrame colunar dos itens (NF-E, cProd, qCom, vUnCom, vProd) com CODPRODUTO numérico para o cruzamento"""
+    df_itens = pd.DataFrame(itens_nfe, columns=['NF-E', 'cProd', 'qCom', 'vUnCom', 'vProd'])
+    df_itens = df_itens.astype({'NF-E': 'int64', 'qCom': 'float64', 'vUnCom': 'float64', 'vProd': 'float64'})
+    df_itens['cProd'] = df_itens['cProd'].astype('category')
+    # Só códigos só de dígitos cruzam com o fechamento; alfanuméricos ('P-100') ficam com CODPRODUTO 0
+    codigos = df_itens['cProd'].astype(str)
+    df_itens.insert(2, 'CODPRODUTO', converter_serie_para_int(codigos.where(codigos.str.fullmatch('[0-9]+'), '')))
+    return df_itens
+
+def buscar_xml_por_data(caminho_indice=CAMINHO_INDICE_NFE, workers=1, incremental=False,
+                        threads_listagem=THREADS_LISTAGEM, data_inicial=None, data_final=None,
+                        raizes=None, resumo=None, detalhe=None, estado=None):
+    """Processa XMLs de notas fiscais por período - VERSÃO OTIMIZADA"""
+    if resumo is None:
+        resumo = {}
+    
+    print("=== PROCESSADOR DE NOTAS FISCAIS ===")
+    if data_inicial is None or data_final is None:
+        data_inicial_str = input("Digite a data inicial (DD/MM/AAAA): ")
+        data_final_str = input("Digite a data final (DD/MM/AAAA): ")
+    else:
+        data_inicial_str, data_final_str = data_inicial, data_final
+    
+    try:
+        data_inicial = datetime.strptime(data_inicial_str, "%d/%m/%Y").date()
+        data_final = datetime.strptime(data_final_str, "%d/%m/%Y").date()
+        
+        # INCLUIR TODOS OS DIAS ENTRE AS DATAS
+        dias_periodo = (data_final - data_inicial).days + 1
+        print(f"📅 Período: {data_inicial_str} a {data_final_str} ({dias_periodo} dias)")
+        
+    except ValueError:
+        print("❌ Formato de data inválido!")
+        resumo['erro'] = "data inválida"
+        return None
+    
+    resumo['periodo'] = [data_inicial.isoformat(), data_final.isoformat()]
+    
+    if estado is not None:
+        estado['por_periodo'] = False
+    coletado = _coletar_notas_periodos([(data_inicial, data_final)], caminho_indice, workers, incremental,
+                                       threads_listagem, raizes, resumo, itens=detalhe is not None, estado=estado)
+    if coletado is None:
+        return None
+    notas, df_itens = coletado
+    if detalhe is not None:
+        detalhe['itens'] = df_itens
+    
+    if notas['tamanho']:
+        df_resultado = df_acumulador_notas(notas)
+        # Ordenação estável: resultado idêntico no modo serial e paralelo
+        df_resultado = df_resultado.sort_values('NF-E', kind='mergesort')
+        return df_resultado
+    else:
+        return None
+
+def ler_periodo(data_inicial, data_final):
+    """Converte um período (date ou texto DD/MM/AAAA) em (date, date); ValueError se inválido"""
+    datas = [datetime.strptime(data, "%d/%m/%Y").date() if isinstance(data, str) else data
+             for data in (data_inicial, data_final)]
+    if datas[0] > datas[1]:
+        raise ValueError(f"período invertido: {data_inicial} a {data_final}")
+    return datas[0], datas[1]
+
+def rotulo_periodo(data_inicial, data_final):
+    """Texto do período usado na coluna PERIODO"""
+    return f"{data_inicial:%d/%m/%Y} a {data_final:%d/%m/%Y}"
+
+def faturamento_do_periodo(df_faturamento, rotulo, notas_periodo):
+    """Linhas do faturamento com DATA no período do rótulo ou das NF-E do período (todas se não houver DATA)"""
+    if 'DATA' not in df_faturamento.columns:
+        return df_faturamento
+    data_inicial, data_final = ler_periodo(*rotulo.split(' a '))
+    datas = pd.to_datetime(df_faturamento['DATA'].astype(str), format="%d/%m/%Y", errors='coerce')
+    # A DATA do faturamento pode não ser a da emissão: as notas do período continuam casando
+    no_periodo = (datas >= pd.Timestamp(data_inicial)) & (datas <= pd.Timestamp(data_final))
+    return df_faturamento[no_periodo | df_faturamento['NF-E'].isin(notas_periodo)]
+
+def buscar_xml_por_periodos(periodos, caminho_indice=CAMINHO_INDICE_NFE, workers=1, incremental=False,
+                            threads_listagem=THREADS_LISTAGEM, raizes=None, resumo=None, detalhe=None,
+                            estado=None):
+    """Processa XMLs de vários períodos numa única varredura (DataFrame com a coluna PERIODO)"""
+    if resumo is None:
+        resumo = {}
+    
+    print("=== PROCESSADOR DE NOTAS FISCAIS (VÁRIOS PERÍODOS) ===")
+    try:
+        periodos = [ler_periodo(data_inicial, data_final) for data_inicial, data_final in periodos]
+    except (TypeError, ValueError) as e:
+        print(f"❌ Período inválido: {e}")
+        resumo['erro'] = "período inválido"
+        return None
+    if not periodos:
+        print("❌ Nenhum período informado!")
+        resumo['erro'] = "nenhum período"
+        return None
+    
+    for data_inicial, data_final in periodos:
+        print(f"📅 Período: {rotulo_periodo(data_inicial, data_final)} ({(data_final - data_inicial).days + 1} dias)")
+    resumo['periodos'] = [[data_inicial.isoformat(), data_final.isoformat()] for data_inicial, data_final in periodos]
+    
+    if estado is not None:
+        estado['por_periodo'] = True
+    coletado = _coletar_notas_periodos(periodos, caminho_indice, workers, incremental,
+                                       threads_listagem, raizes, resumo, itens=detalhe is not None, estado=estado)
+    if coletado is None or not coletado[0]['tamanho']:
+        return None
+    notas, df_itens = coletado
+    if detalhe is not None:
+        detalhe['itens'] = df_itens
+    
+    return separar_notas_por_periodo(notas, periodos, resumo)
+
+def separar_notas_por_periodo(notas, periodos, resumo):
+    """DataFrame das notas do acumulador com a coluna PERIODO (uma fatia por período, contagens em resumo)"""
+    df_notas = df_acumulador_notas(notas)
+    datas = notas['emissao'][:notas['tamanho']]
+    
+    # Uma fatia por período (períodos podem se sobrepor), ordenada como em buscar_xml_por_data
+    partes = []
+    resumo['notas_por_periodo'] = {}
+    for data_inicial, data_final in periodos:
+        rotulo = rotulo_periodo(data_inicial, data_final)
+        dentro = (datas >= np.datetime64(data_inicial)) & (datas <= np.datetime64(data_final))
+        parte = df_notas[dentro].sort_values('NF-E', kind='mergesort')
+        parte.insert(0, 'PERIODO', rotulo)
+        partes.append(parte)
+        resumo['notas_por_periodo'][rotulo] = int(dentro.sum())
+        print(f"📅 {rotulo}: {len(parte)} notas | R$ {total_em_reais(parte['Valor XML']):,.2f}")
+    
+    return pd.concat(partes, ignore_index=True)
+
+def aplicar_historico_iterativo(df_principal, df_historico):
+    """Aplica o histórico linha a linha (HISTORICO 68 remove, 51 define PESO) - versão original"""
+    linhas_para_remover = []
+    indices_com_peso = []
+    
+    for idx, row_principal in df_principal.iterrows():
+        mask = (
+            (df_historico['ROMANEIO'] == row_principal['ROMANEIO']) &
+            (df_historico['NOTA FISCAL'] == row_principal['NF-E']) &
+            (df_historico['PRODUTO'] == row_principal['CODPRODUTO'])
+        )
+        
+        correspondencias = df_historico[mask]
+        
+        if not correspondencias.empty:
+            historico_valor = pd.to_numeric(correspondencias['HISTORICO'].iloc[0], errors='coerce')
+            
+            if historico_valor == 68:
+                linhas_para_remover.append(idx)
+            elif historico_valor == 51 and 'PESO' in correspondencias.columns:
+                peso_valor = converter_para_float(correspondencias['PESO'].iloc[0])
+                indices_com_peso.append((idx, peso_valor))
+    
+    # drop devolve um novo DataFrame mesmo sem linhas a remover: o PESO não é gravado no do chamador
+    df_principal = df_principal.drop(linhas_para_remover)
+    
+    for idx, peso in indices_com_peso:
+        if idx in df_principal.index:
+            df_principal.at[idx, 'PESO'] = peso
+    
+    return df_principal
+
+def aplicar_historico_vetorizado(df_principal, df_historico, historico_unico=False):
+    """Aplica o histórico com um merge pela chave ROMANEIO/NF-E/PRODUTO (primeira ocorrência vale)"""
+    chave = ['ROMANEIO', 'NOTA FISCAL', 'PRODUTO']
+    
+    # Primeira linha do histórico para cada chave, como no filtro linha a linha
+    df_primeiras = df_historico if historico_unico else df_historico.drop_duplicates(subset=chave, keep='first')
+    
+    df_chaves = df_principal[['ROMANEIO', 'NF-E', 'CODPRODUTO']].rename(
+        columns={'NF-E': 'NOTA FISCAL', 'CODPRODUTO': 'PRODUTO'})
+    
+    # Left join com chave única à direita: mesma ordem e quantidade de linhas do principal
+    df_cruzado = df_chaves.merge(df_primeiras, on=chave, how='left')
+    historico_valor = pd.to_numeric(df_cruzado['HISTORICO'], errors='coerce').to_numpy()
+    
+    if 'PESO' in df_cruzado.columns:
+        com_peso = historico_valor == 51
+        if com_peso.any():
+            df_principal = df_principal.copy()
+            df_principal.loc[com_peso, 'PESO'] = converter_serie_para_float(df_cruzado.loc[com_peso, 'PESO']).to_numpy()
+    
+    return df_principal[historico_valor != 68]
+
+def comparar_resultados_historico(df_iterativo, df_vetorizado):
+    """Confere se as versões iterativa e vetorizada do histórico produzem o mesmo resultado"""
+    if df_iterativo.index.equals(df_vetorizado.index) and df_iterativo['PESO'].equals(df_vetorizado['PESO']):
+        print(f"✅ Histórico: versões iterativa e vetorizada idênticas ({len(df_vetorizado)} linhas)")
+        return True
+    
+    so_iterativo = df_iterativo.index.difference(df_vetorizado.index)
+    so_vetorizado = df_vetorizado.index.difference(df_iterativo.index)
+    comuns = df_iterativo.index.intersection(df_vetorizado.index)
+    peso_diferente = (df_iterativo.loc[comuns, 'PESO'] != df_vetorizado.loc[comuns, 'PESO']).sum()
+    print(f"⚠️ Histórico: divergências entre versões - {len(so_iterativo)} linhas só na iterativa, "
+          f"{len(so_vetorizado)} só na vetorizada, {peso_diferente} com PESO diferente")
+    return False
+
+def ler_csv_sistema(caminho, etapa, **opcoes):
+    """Lê um CSV do sistema (separador ';', encoding detectado) registrando a etapa nas métricas"""
+    with medir_etapa(etapa) as contagem:
+        encoding = detectar_encoding(caminho)
+        df = pd.read_csv(caminho, encoding=encoding, sep=';', encoding_errors='replace', **opcoes)
+        contagem['itens'], contagem['bytes'] = 1, os.path.getsize(caminho)
+    return df
+
+def ler_csv_em_blocos(caminho, etapa, colunas, tamanho_bloco):
+    """Lê só as colunas pedidas do CSV, como texto, em blocos de tamanho_bloco linhas"""
+    encoding = detectar_encoding(caminho)
+    inicio = time.perf_counter()
+    leitor = pd.read_csv(caminho, encoding=encoding, sep=';', encoding_errors='replace', dtype=str,
+                         usecols=lambda coluna: coluna.strip().upper() in colunas, chunksize=tamanho_bloco)
+    segundos = time.perf_counter() - inicio
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                bloco = next(leitor)
+            except StopIteration:
+                break
+            segundos += time.perf_counter() - inicio
+            bloco.columns = bloco.columns.str.strip().str.upper()
+            yield bloco
+    finally:
+        leitor.close()
+        registrar_etapa(etapa, segundos, 1, os.path.getsize(caminho))
+
+def converter_chave_compacta(serie):
+    """converter_serie_para_int em int32 quando todos os valores cabem (senão int64)"""
+    inteiros = converter_serie_para_int(serie)
+    limites = np.iinfo(np.int32)
+    if len(inteiros) == 0 or (inteiros.min() >= limites.min and inteiros.max() <= limites.max):
+        return inteiros.astype('int32')
+    return inteiros
+
+def unir_categorias(series):
+    """Concatena colunas category dos blocos; categorias só com números viram inteiros"""
+    unida = pd.api.types.union_categoricals(series, ignore_order=True)
+    categorias = unida.categories
+    if len(categorias) and categorias.str.fullmatch(r'-?\d{1,18}').all():
+        # '1' e '01' viram a mesma categoria: os códigos são remapeados para os inteiros únicos
+        inteiros = categorias.astype('int64')
+        unicos = pd.Index(inteiros.unique())
+        novos_codigos = unicos.get_indexer(inteiros)
+        unida = pd.Categorical.from_codes(np.where(unida.codes >= 0, novos_codigos[unida.codes], -1),
+                                          categories=unicos)
+    return unida
+
+def carregar_historico_em_blocos(caminho_historico, tamanho_bloco):
+    """Histórico com uma linha por ROMANEIO/NOTA FISCAL/PRODUTO (a primeira), lido em blocos"""
+    chave = ['ROMANEIO', 'NOTA FISCAL', 'PRODUTO']
+    blocos = []
+    for bloco in ler_csv_em_blocos(caminho_historico, 'csv_historico', COLUNAS_HISTORICO, tamanho_bloco):
+        if not set(chave + ['HISTORICO']) <= set(bloco.columns):
+            return pd.DataFrame()
+        for coluna in chave:
+            bloco[coluna] = converter_chave_compacta(bloco[coluna])
+        blocos.append(bloco.drop_duplicates(subset=chave, keep='first'))
+    if not blocos:
+        return None
+    # Blocos na ordem do arquivo: a primeira ocorrência de cada chave continua valendo
+    return pd.concat(blocos, ignore_index=True).drop_duplicates(subset=chave, keep='first')
+
+def processar_faturamento_em_blocos(caminho_fechamento, caminho_cancelados, caminho_historico,
+                                    tamanho_bloco=TAMANHO_BLOCO_CSV):
+    """Mesmo resultado de processar_faturamento_bruto (modo vetorizado) com memória limitada"""
+    try:
+        df_cancelados = carregar_cancelados(caminho_cancelados)
+        nfes_cancelados = None if df_cancelados is None else df_cancelados['NF-E'].unique()
+    except Exception:
+        nfes_cancelados = None
     
-    except Exception as e:
-        print(f"⚠️ Erro ao processar {os.path.basename(caminho_completo)}: {e}")
+    try:
+        df_historico = carregar_historico_em_blocos(caminho_historico, tamanho_bloco)
+    except Exception:
+        df_historico = None
     
-    return None
+    blocos = []
+    linhas_lidas = 0
+    for bloco in ler_csv_em_blocos(caminho_fechamento, 'csv_fechamento', COLUNAS_FECHAMENTO, tamanho_bloco):
+        linhas_lidas += len(bloco)
+        bloco = bloco[[col for col in COLUNAS_FECHAMENTO if col in bloco.columns]]
+        
+        for coluna in COLUNAS_CHAVE_FECHAMENTO:
+            if coluna in bloco.columns:
+                bloco[coluna] = converter_chave_compacta(bloco[coluna])
+        
+        bloco['PRECO VENDA'] = converter_serie_para_float(bloco['PRECO VENDA'])
+        bloco = bloco[bloco['PRECO VENDA'] >= 0]
+        
+        if nfes_cancelados is not None:
+            bloco = bloco[~bloco['NF-E'].isin(nfes_cancelados)]
+        
+        if df_historico is not None:
+            bloco = bloco.assign(PESO=0.0)
+            if not df_historico.empty:
+                with medir_etapa('merge_historico') as contagem:
+                    contagem['itens'] = len(bloco)
+                    bloco = aplicar_historico_vetorizado(bloco, df_historico, historico_unico=True)
+            bloco['PESO'] = converter_serie_para_float(bloco['PESO'])
+            bloco['FAT BRUTO'] = calcular_fat_bruto(bloco)
+        
+        for coluna in COLUNAS_CATEGORIA_FECHAMENTO:
+            if coluna in bloco.columns:
+                bloco[coluna] = bloco[coluna].astype('category')
+        blocos.append(bloco)
+        print(f"📦 {linhas_lidas} linhas do fechamento lidas...")
+    
+    if not blocos or linhas_lidas == 0:
+        return None
+    
+    if df_historico is None:
+        # Sem histórico não há PESO - mesmo erro do processamento em arquivo inteiro
+        raise KeyError('PESO')
+    
+    df_principal = pd.concat(blocos)
+    for coluna in COLUNAS_CATEGORIA_FECHAMENTO:
+        if coluna in df_principal.columns:
+            df_principal[coluna] = pd.Series(unir_categorias([bloco[coluna] for bloco in blocos]),
+                                             index=df_principal.index)
+    return df_principal
 
-def buscar_xml_por_data():
-    """Processa XMLs de notas fiscais por período - VERSÃO OTIMIZADA"""
-    print("=== PROCESSADOR DE NOTAS FISCAIS ===")
-    data_inicial_str = input("Digite a data inicial (DD/MM/AAAA): ")
-    data_final_str = input("Digite a data final (DD/MM/AAAA): ")
+def hash_arquivo(caminho):
+    """SHA-1 do conteúdo do arquivo, lido em blocos de 1 MB"""
+    resumo = hashlib.sha1()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+def abrir_cache_csv(pasta_cache):
+    """Abre (ou cria) o catálogo SQLite das entradas do cache de CSVs"""
+    os.makedirs(pasta_cache, exist_ok=True)
+    conexao = sqlite3.connect(os.path.join(pasta_cache, "cache_csv.sqlite"), timeout=30)
+    conexao.execute("""
+        CREATE TABLE IF NOT EXISTS entradas_csv (
+            chave TEXT PRIMARY KEY,
+            origem TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha1 TEXT NOT NULL,
+            arquivo TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            ultimo_uso REAL NOT NULL
+        )
+    """)
+    return conexao
+
+def podar_cache_csv(conexao, pasta_cache, limite_mb):
+    """Remove as entradas usadas há mais tempo até o cache caber em limite_mb"""
+    limite = limite_mb * 1024 * 1024
+    total = conexao.execute("SELECT COALESCE(SUM(bytes), 0) FROM entradas_csv").fetchone()[0]
+    for chave, arquivo, tamanho in conexao.execute(
+            "SELECT chave, arquivo, bytes FROM entradas_csv ORDER BY ultimo_uso").fetchall():
+        if total <= limite:
+            break
+        try:
+            os.remove(os.path.join(pasta_cache, arquivo))
+        except OSError:
+            pass
+        conexao.execute("DELETE FROM entradas_csv WHERE chave = ?", (chave,))
+        total -= tamanho
+    conexao.commit()
+
+def ler_com_cache_csv(caminho, tipo, carregador, pasta_cache=None, limite_mb=LIMITE_CACHE_CSV_MB):
+    """carregador(caminho) com o resultado guardado em Parquet, válido enquanto o CSV não mudar"""
+    if pasta_cache is None or importlib.util.find_spec('pyarrow') is None:
+        return carregador(caminho)
     
+    estado = os.stat(caminho)
+    origem = os.path.abspath(caminho)
+    chave = hashlib.sha1(f"{VERSAO_CACHE_CSV}|{tipo}|{origem}".encode('utf-8')).hexdigest()
+    conexao = abrir_cache_csv(pasta_cache)
     try:
-        data_inicial = datetime.strptime(data_inicial_str, "%d/%m/%Y").date()
-        data_final = datetime.strptime(data_final_str, "%d/%m/%Y").date()
+        registro = conexao.execute("SELECT tamanho, mtime_ns, sha1, arquivo FROM entradas_csv WHERE chave = ?",
+                                   (chave,)).fetchone()
+        sha1 = None
+        # Mesmo tamanho: vale o mtime ou, se só ele mudou (CSV copiado de novo para o S:), o SHA-1
+        if registro is not None and registro[0] == estado.st_size:
+            _, mtime_ns, sha1_salvo, arquivo = registro
+            if mtime_ns != estado.st_mtime_ns:
+                sha1 = hash_arquivo(caminho)
+            if mtime_ns == estado.st_mtime_ns or sha1 == sha1_salvo:
+                try:
+                    caminho_parquet = os.path.join(pasta_cache, arquivo)
+                    with medir_etapa('cache_csv') as contagem:
+                        df = pd.read_parquet(caminho_parquet, engine='pyarrow')
+                        contagem['itens'], contagem['bytes'] = 1, os.path.getsize(caminho_parquet)
+                    conexao.execute("UPDATE entradas_csv SET mtime_ns = ?, ultimo_uso = ? WHERE chave = ?",
+                                    (estado.st_mtime_ns, time.time(), chave))
+                    conexao.commit()
+                    print(f"⚡ {os.path.basename(caminho)} carregado do cache ({len(df)} linhas)")
+                    return df
+                except Exception:
+                    pass  # Parquet apagado ou corrompido: lê o CSV de novo
         
-        # INCLUIR TODOS OS DIAS ENTRE AS DATAS
-        dias_periodo = (data_final - data_inicial).days + 1
-        print(f"📅 Período: {data_inicial_str} a {data_final_str} ({dias_periodo} dias)")
+        # Hash antes da leitura: se o CSV mudar no meio, a próxima execução percebe
+        sha1 = sha1 or hash_arquivo(caminho)
+        df = carregador(caminho)
+        if df is None:
+            return None
         
-    except ValueError:
-        print("❌ Formato de data inválido!")
+        try:
+            arquivo = f"{chave}.parquet"
+            caminho_parquet = os.path.join(pasta_cache, arquivo)
+            # Temporário com nome único: execuções simultâneas não escrevem no mesmo arquivo
+            with tempfile.NamedTemporaryFile(dir=pasta_cache, prefix=f"{chave}.", suffix=".tmp", delete=False) as f:
+                caminho_temporario = f.name
+            try:
+                df.to_parquet(caminho_temporario, engine='pyarrow')
+                os.replace(caminho_temporario, caminho_parquet)
+            finally:
+                if os.path.exists(caminho_temporario):
+                    os.remove(caminho_temporario)
+            conexao.execute("INSERT OR REPLACE INTO entradas_csv VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (chave, origem, tipo, estado.st_size, estado.st_mtime_ns, sha1, arquivo,
+                             os.path.getsize(caminho_parquet), time.time()))
+            conexao.commit()
+            podar_cache_csv(conexao, pasta_cache, limite_mb)
+        except Exception as e:
+            print(f"⚠️ {os.path.basename(caminho)} não foi guardado no cache: {e}")
+        return df
+    finally:
+        conexao.close()
+
+def carregar_fechamento(caminho_fechamento):
+    """Lê o fechamento com as colunas usadas, chaves inteiras e PRECO VENDA >= 0 (ou None se vazio)"""
+    df_principal = ler_csv_sistema(caminho_fechamento, 'csv_fechamento', decimal=',')
+    
+    if df_principal.empty:
         return None
     
-    # Lista de caminhos - INCLUINDO PASTAS ENVIADO
-    caminhos_xml = [
-        r"S:\hor\nfe",
-        r"S:\hor\nfe2",
-        r"S:\hor\nfe\enviado",  # NOVO
-        r"S:\hor\nfe2\enviado"  # NOVO
-    ]
-    
-    caminhos_eventos = [
-        r"S:\hor\nfe\eventos",
-        r"S:\hor\nfe2\eventos"
-    ]
-    
-    caminhos_recusado = [
-        r"S:\hor\nfe\recusado",
-        r"S:\hor\nfe2\recusado"
-    ]
+    df_principal.columns = df_principal.columns.str.strip().str.upper()
     
-    # Verificar diretórios
-    diretorios_existentes = [c for c in caminhos_xml if os.path.exists(c)]
-    if not diretorios_existentes:
-        print("❌ Nenhum diretório encontrado!")
-        return None
+    colunas_existentes = [col for col in COLUNAS_FECHAMENTO if col in df_principal.columns]
     
-    print("⏳ Carregando arquivos .can...")
-    arquivos_can = carregar_arquivos_can_rapido(caminhos_eventos)
-    print(f"📄 {len(arquivos_can)} arquivos .can carregados")
+    if not colunas_existentes:
+        return None
     
-    print("⏳ Buscando arquivos XML no período...")
+    df_principal = df_principal[colunas_existentes]
     
-    dados_nfe = []
-    total_arquivos = 0
-    arquivos_no_periodo = 0
-    notas_processadas = 0
-    notas_inutilizadas = 0
+    print("⏳ Convertendo colunas para numérico...")
     
-    # PRIMEIRO: Buscar RAPIDAMENTE arquivos no período
-    arquivos_para_processar = []
-    arquivos_unicos = set()  # CONJUNTO PARA EVITAR DUPLICATAS
+    if 'ROMANEIO' in df_principal.columns:
+        df_principal['ROMANEIO'] = converter_serie_para_int(df_principal['ROMANEIO'])
     
-    for caminho_xml in diretorios_existentes:
-        print(f"🔍 Escaneando {caminho_xml}...")
-        
-        try:
-            # Listar arquivos uma única vez
-            with os.scandir(caminho_xml) as entries:
-                arquivos_lista = [entry for entry in entries if entry.is_file() and entry.name.lower().endswith('.xml')]
-            
-            total_arquivos += len(arquivos_lista)
-            
-            # Verificar data de cada arquivo (RÁPIDO)
-            for entry in arquivos_lista:
-                # VERIFICAR SE JÁ PROCESSAMOS ESTE ARQUIVO (PELO NOME)
-                if entry.name in arquivos_unicos:
-                    continue  # PULAR ARQUIVO DUPLICADO
-                
-                caminho_completo = os.path.join(caminho_xml, entry.name)
-                data_emissao = extrair_data_rapido_xml(caminho_completo)
-                
-                if data_emissao and data_inicial <= data_emissao <= data_final:
-                    arquivos_para_processar.append(caminho_completo)
-                    arquivos_unicos.add(entry.name)  # ADICIONAR AO CONJUNTO
-                    arquivos_no_periodo += 1
-                    
-        except Exception as e:
-            print(f"⚠️ Erro em {caminho_xml}: {e}")
+    if 'NF-E' in df_principal.columns:
+        df_principal['NF-E'] = converter_serie_para_int(df_principal['NF-E'])
     
-    print(f"📊 Total de arquivos XML encontrados: {total_arquivos}")
-    print(f"📅 Arquivos únicos no período: {arquivos_no_periodo}")
+    if 'CODPRODUTO' in df_principal.columns:
+        df_principal['CODPRODUTO'] = converter_serie_para_int(df_principal['CODPRODUTO'])
     
-    if arquivos_no_periodo == 0:
-        print("❌ Nenhum arquivo no período especificado.")
+    df_principal['PRECO VENDA'] = converter_serie_para_float(df_principal['PRECO VENDA'])
+    return df_principal[df_principal['PRECO VENDA'] >= 0]
+
+def carregar_cancelados(caminho_cancelados):
+    """NF-E canceladas (primeira coluna do can.csv) num DataFrame de uma coluna (ou None)"""
+    df_cancelados = ler_csv_sistema(caminho_cancelados, 'csv_cancelados', skiprows=2)
+    if len(df_cancelados.columns) == 0:
         return None
-    
-    # SEGUNDO: Processar APENAS os arquivos do período
-    print("⏳ Processando arquivos...")
+    return pd.DataFrame({'NF-E': converter_serie_para_int(df_cancelados.iloc[:, 0].dropna())})
 
-    for i, caminho_completo in enumerate(arquivos_para_processar, 1):
-        if i % 50 == 0:  # Progresso a cada 50 arquivos
-            print(f"📦 Processados {i}/{arquivos_no_periodo} arquivos...")
-        
-        dados = processar_xml_completo(caminho_completo, arquivos_can, caminhos_recusado, caminhos_eventos)
-        if dados:
-            dados_nfe.append(dados)
-            notas_processadas += 1
-    
-    print(f"\n📊 RESUMO FINAL:")
-    print(f"📄 Arquivos únicos no período: {arquivos_no_periodo}")
-    print(f"✅ Notas processadas: {notas_processadas}")
-    print(f"🚫 Notas inutilizadas (NÃO AUTORIZADA): {notas_inutilizadas}")
-    print(f"💰 Valor total: R$ {sum(d['Valor XML'] for d in dados_nfe):,.2f}")
+def carregar_historico(caminho_historico):
+    """Histórico com as colunas usadas e chaves inteiras (ou None se não tiver nenhuma)"""
+    df_historico = ler_csv_sistema(caminho_historico, 'csv_historico')
+    df_historico.columns = df_historico.columns.str.strip().str.upper()
     
-    if dados_nfe:
-        df_resultado = pd.DataFrame(dados_nfe)
-        df_resultado = df_resultado.sort_values('NF-E')
-        return df_resultado
-    else:
+    colunas_existentes_hist = [col for col in COLUNAS_HISTORICO if col in df_historico.columns]
+    if not colunas_existentes_hist:
         return None
     
-def processar_faturamento_bruto():
+    df_historico = df_historico[colunas_existentes_hist]
+    
+    if 'ROMANEIO' in df_historico.columns:
+        df_historico['ROMANEIO'] = converter_serie_para_int(df_historico['ROMANEIO'])
+    if 'NOTA FISCAL' in df_historico.columns:
+        df_historico['NOTA FISCAL'] = converter_serie_para_int(df_historico['NOTA FISCAL'])
+    if 'PRODUTO' in df_historico.columns:
+        df_historico['PRODUTO'] = converter_serie_para_int(df_historico['PRODUTO'])
+    return df_historico
+
+def processar_faturamento_bruto(modo_historico='vetorizado', caminho_fechamento=None,
+                                caminho_cancelados=None, caminho_historico=None, tamanho_bloco=None,
+                                pasta_cache_csv=None, limite_cache_csv_mb=LIMITE_CACHE_CSV_MB):
     """Processa arquivos CSV para faturamento bruto"""
-    caminho_fechamento = r"S:\hor\excel\fechamento-20260501-20260513.csv"
-    caminho_cancelados = r"S:\hor\arquivos\gustavo\can.csv"
-    caminho_historico = r"S:\hor\excel\20260501.csv"
+    caminho_fechamento = caminho_fechamento or CAMINHO_FECHAMENTO
+    caminho_cancelados = caminho_cancelados or CAMINHO_CANCELADOS
+    caminho_historico = caminho_historico or CAMINHO_HISTORICO
     
-    try:
-        encoding_fechamento = detectar_encoding(caminho_fechamento)
-        df_principal = pd.read_csv(caminho_fechamento, encoding=encoding_fechamento, sep=';', decimal=',')
-        
-        if df_principal.empty:
+    if tamanho_bloco:
+        if modo_historico != 'vetorizado':
+            print(f"⚠️ Leitura em blocos usa o histórico vetorizado (modo '{modo_historico}' ignorado)")
+        try:
+            df_principal = processar_faturamento_em_blocos(caminho_fechamento, caminho_cancelados,
+                                                           caminho_historico, tamanho_bloco)
+        except Exception as e:
+            print(f"❌ Erro no processamento: {e}")
             return None
-        
-        df_principal.columns = df_principal.columns.str.strip().str.upper()
-        
-        colunas_necessarias = ['LOJA', 'RAZAO', 'GRUPO', 'ROMANEIO', 'NF-E', 'DATA', 
-                              'VENDEDOR', 'CODPRODUTO', 'GRUPO PRODUTO', 'DESCRICAO', 'PRECO VENDA']
-        colunas_existentes = [col for col in colunas_necessarias if col in df_principal.columns]
-        
-        if not colunas_existentes:
+        if df_principal is not None:
+            print(f"✅ {len(df_principal)} linhas processadas")
+        return df_principal
+    
+    try:
+        df_principal = ler_com_cache_csv(caminho_fechamento, 'fechamento', carregar_fechamento,
+                                         pasta_cache_csv, limite_cache_csv_mb)
+        if df_principal is None:
             return None
         
-        df_principal = df_principal[colunas_existentes]
-        
-        print("⏳ Convertendo colunas para numérico...")
-        
-        if 'ROMANEIO' in df_principal.columns:
-            df_principal['ROMANEIO'] = df_principal['ROMANEIO'].apply(converter_para_int)
-        
-        if 'NF-E' in df_principal.columns:
-            df_principal['NF-E'] = df_principal['NF-E'].apply(converter_para_int)
-        
-        if 'CODPRODUTO' in df_principal.columns:
-            df_principal['CODPRODUTO'] = df_principal['CODPRODUTO'].apply(converter_para_int)
-        
-        df_principal['PRECO VENDA'] = df_principal['PRECO VENDA'].apply(converter_para_float)
-        df_principal = df_principal[df_principal['PRECO VENDA'] >= 0]
-        
         try:
-            encoding_cancelados = detectar_encoding(caminho_cancelados)
-            df_cancelados = pd.read_csv(caminho_cancelados, skiprows=2, encoding=encoding_cancelados, sep=';')
-            
-            if len(df_cancelados.columns) > 0:
-                nfes_cancelados = df_cancelados.iloc[:, 0].dropna().apply(converter_para_int).unique()
-                df_principal = df_principal[~df_principal['NF-E'].isin(nfes_cancelados)]
+            df_cancelados = ler_com_cache_csv(caminho_cancelados, 'cancelados', carregar_cancelados,
+                                              pasta_cache_csv, limite_cache_csv_mb)
+            if df_cancelados is not None:
+                df_principal = df_principal[~df_principal['NF-E'].isin(df_cancelados['NF-E'].unique())]
         except Exception:
             pass
         
         try:
-            encoding_historico = detectar_encoding(caminho_historico)
-            df_historico = pd.read_csv(caminho_historico, encoding=encoding_historico, sep=';')
-            df_historico.columns = df_historico.columns.str.strip().str.upper()
-            
-            colunas_historico = ['ROMANEIO', 'NOTA FISCAL', 'PRODUTO', 'HISTORICO', 'PESO']
-            colunas_existentes_hist = [col for col in colunas_historico if col in df_historico.columns]
+            df_historico = ler_com_cache_csv(caminho_historico, 'historico', carregar_historico,
+                                             pasta_cache_csv, limite_cache_csv_mb)
             
-            if colunas_existentes_hist:
-                df_historico = df_historico[colunas_existentes_hist]
-                
-                if 'ROMANEIO' in df_historico.columns:
-                    df_historico['ROMANEIO'] = df_historico['ROMANEIO'].apply(converter_para_int)
-                if 'NOTA FISCAL' in df_historico.columns:
-                    df_historico['NOTA FISCAL'] = df_historico['NOTA FISCAL'].apply(converter_para_int)
-                if 'PRODUTO' in df_historico.columns:
-                    df_historico['PRODUTO'] = df_historico['PRODUTO'].apply(converter_para_int)
-                
+            if df_historico is not None:
                 df_principal['PESO'] = 0.0
                 
-                linhas_para_remover = []
-                indices_com_peso = []
-                
-                for idx, row_principal in df_principal.iterrows():
-                    mask = (
-                        (df_historico['ROMANEIO'] == row_principal['ROMANEIO']) &
-                        (df_historico['NOTA FISCAL'] == row_principal['NF-E']) &
-                        (df_historico['PRODUTO'] == row_principal['CODPRODUTO'])
-                    )
-                    
-                    correspondencias = df_historico[mask]
-                    
-                    if not correspondencias.empty:
-                        historico_valor = pd.to_numeric(correspondencias['HISTORICO'].iloc[0], errors='coerce')
-                        
-                        if historico_valor == 68:
-                            linhas_para_remover.append(idx)
-                        elif historico_valor == 51 and 'PESO' in correspondencias.columns:
-                            peso_valor = converter_para_float(correspondencias['PESO'].iloc[0])
-                            indices_com_peso.append((idx, peso_valor))
-                
-                if linhas_para_remover:
-                    df_principal = df_principal.drop(linhas_para_remover)
-                
-                for idx, peso in indices_com_peso:
-                    if idx in df_principal.index:
-                        df_principal.at[idx, 'PESO'] = peso
+                with medir_etapa('merge_historico') as contagem:
+                    contagem['itens'] = len(df_historico)
+                    if modo_historico == 'iterativo':
+                        df_principal = aplicar_historico_iterativo(df_principal, df_historico)
+                    elif modo_historico == 'comparar':
+                        df_iterativo = aplicar_historico_iterativo(df_principal, df_historico)
+                        df_principal = aplicar_historico_vetorizado(df_principal, df_historico)
+                        comparar_resultados_historico(df_iterativo, df_principal)
+                    else:
+                        df_principal = aplicar_historico_vetorizado(df_principal, df_historico)
                         
         except Exception:
             pass
         
-        df_principal['PESO'] = df_principal['PESO'].apply(converter_para_float)
-        df_principal['FAT BRUTO'] = df_principal['PRECO VENDA'] * df_principal['PESO']
+        df_principal['PESO'] = converter_serie_para_float(df_principal['PESO'])
+        df_principal['FAT BRUTO'] = calcular_fat_bruto(df_principal)
         
         print(f"✅ {len(df_principal)} linhas processadas")
         return df_principal
@@ -493,10 +1991,215 @@ def processar_faturamento_bruto():
         print(f"❌ Erro no processamento: {e}")
         return None
 
-def criar_tabela_excel_com_formatacao(df_xml, df_faturamento):
+def classificar_conciliacao(df_conciliacao, coluna_xml, tolerancia):
+    """DIFERENCA (FAT BRUTO - coluna_xml) e SITUACAO de um merge outer com indicator; remove o _merge"""
+    # Diferença em centavos: somas de float viram centavos exatos antes de subtrair
+    diferenca = (reais_para_centavos(df_conciliacao['FAT BRUTO'].fillna(0.0))
+                 - reais_para_centavos(df_conciliacao[coluna_xml].fillna(0.0)))
+    df_conciliacao['DIFERENCA'] = diferenca / 100
+    df_conciliacao['SITUACAO'] = np.select(
+        [df_conciliacao['_merge'] == 'left_only',
+         df_conciliacao['_merge'] == 'right_only',
+         np.abs(diferenca) <= round(tolerancia * 100)],
+        ['SÓ XML', 'SÓ SISTEMA', 'OK'],
+        default='DIVERGENTE'
+    )
+    return df_conciliacao.drop(columns='_merge')
+
+def imprimir_situacoes(titulo, df_conciliacao):
+    """Mostra quantas linhas da conciliação caíram em cada SITUACAO"""
+    contagem = df_conciliacao['SITUACAO'].value_counts()
+    print(f"🔗 {titulo}: {contagem.get('OK', 0)} OK | {contagem.get('DIVERGENTE', 0)} divergentes | "
+          f"{contagem.get('SÓ XML', 0)} só no XML | {contagem.get('SÓ SISTEMA', 0)} só no sistema")
+
+def conciliar_sistema_xml(df_xml, df_faturamento, tolerancia=TOLERANCIA_CONCILIACAO):
+    """Cruza o FAT BRUTO somado por NF-E com o Valor XML da nota (SITUACAO por NF-E)"""
+    if 'NF-E' not in df_faturamento.columns or 'FAT BRUTO' not in df_faturamento.columns:
+        print("⚠️ Faturamento sem colunas NF-E/FAT BRUTO - conciliação não realizada")
+        return None
+    
+    # Agregar as linhas de produto por nota (groupby + merge = hash join, sem PROCV)
+    faturamento = df_faturamento[df_faturamento['NF-E'] != 0]
+    agregacoes = {'FAT BRUTO': ('FAT BRUTO', 'sum'), 'Itens Sistema': ('FAT BRUTO', 'size')}
+    if 'ROMANEIO' in faturamento.columns:
+        agregacoes = {'Romaneio Sistema': ('ROMANEIO', 'first'), **agregacoes}
+    sistema = faturamento.groupby('NF-E', sort=False).agg(**agregacoes).reset_index()
+    
+    notas = df_xml.groupby('NF-E', sort=False).agg(
+        **{'Romaneio XML': ('Romaneio', 'first'), 'DATA': ('DATA', 'first'), 'Valor XML': ('Valor XML', 'sum')}
+    ).reset_index()
+    
+    df_conciliacao = notas.merge(sistema, on='NF-E', how='outer', indicator=True, sort=True)
+    df_conciliacao = classificar_conciliacao(df_conciliacao, 'Valor XML', tolerancia)
+    
+    # Lado ausente vira 0/vazio (como nas demais abas): a SITUACAO já diz de que lado a nota falta
+    for coluna in ('Romaneio XML', 'Romaneio Sistema', 'Itens Sistema'):
+        if coluna in df_conciliacao.columns:
+            df_conciliacao[coluna] = df_conciliacao[coluna].fillna(0).astype('int64')
+    df_conciliacao[['Valor XML', 'FAT BRUTO']] = df_conciliacao[['Valor XML', 'FAT BRUTO']].fillna(0.0)
+    
+    imprimir_situacoes("Conciliação", df_conciliacao)
+    return df_conciliacao
+
+def conciliar_itens_xml(df_itens, df_faturamento, tolerancia=TOLERANCIA_CONCILIACAO):
+    """Cruza os itens do XML com as linhas do faturamento por NF-E + CODPRODUTO"""
+    colunas = {'NF-E', 'CODPRODUTO', 'FAT BRUTO'}
+    if not colunas <= set(df_faturamento.columns):
+        print("⚠️ Faturamento sem colunas NF-E/CODPRODUTO/FAT BRUTO - conciliação por item não realizada")
+        return None
+    
+    chave = ['NF-E', 'CODPRODUTO']
+    notas_comuns = np.intersect1d(df_itens['NF-E'].unique(), df_faturamento['NF-E'].unique())
+    itens = df_itens[df_itens['NF-E'].isin(notas_comuns)]
+    sem_codigo = itens['CODPRODUTO'] == 0
+    if sem_codigo.any():
+        print(f"⚠️ {int(sem_codigo.sum())} itens com cProd não numérico fora da conciliação por item")
+        itens = itens[~sem_codigo]
+    faturamento = df_faturamento[df_faturamento['NF-E'].isin(notas_comuns)]
+    
+    xml = itens.groupby(chave, sort=False).agg(
+        **{'cProd': ('cProd', 'first'), 'Qtd XML': ('qCom', 'sum'), 'Preço XML': ('vUnCom', 'first'),
+           'Valor Item XML': ('vProd', 'sum')}
+    ).reset_index()
+    agregacoes = {'FAT BRUTO': ('FAT BRUTO', 'sum'), 'Linhas Sistema': ('FAT BRUTO', 'size')}
+    if 'PESO' in faturamento.columns:
+        agregacoes = {'PESO Sistema': ('PESO', 'sum'), **agregacoes}
+    if 'PRECO VENDA' in faturamento.columns:
+        agregacoes = {'PRECO VENDA': ('PRECO VENDA', 'first'), **agregacoes}
+    sistema = faturamento.groupby(chave, sort=False).agg(**agregacoes).reset_index()
+    sistema[chave] = sistema[chave].astype('int64')
+    
+    df_conciliacao = xml.merge(sistema, on=chave, how='outer', indicator=True, sort=True)
+    df_conciliacao = classificar_conciliacao(df_conciliacao, 'Valor Item XML', tolerancia)
+    
+    # Lado ausente vira 0/vazio, como na conciliação por NF-E
+    numericas = [coluna for coluna in ('Qtd XML', 'Preço XML', 'Valor Item XML', 'PRECO VENDA', 'PESO Sistema',
+                                       'FAT BRUTO') if coluna in df_conciliacao.columns]
+    df_conciliacao[numericas] = df_conciliacao[numericas].fillna(0.0)
+    df_conciliacao['Linhas Sistema'] = df_conciliacao['Linhas Sistema'].fillna(0).astype('int64')
+    df_conciliacao['cProd'] = df_conciliacao['cProd'].astype(object).fillna('')
+    
+    imprimir_situacoes("Conciliação por item", df_conciliacao)
+    return df_conciliacao
+
+def calcular_larguras_colunas(df, valores_total):
+    """Largura de cada coluna (maior texto + 2) sem percorrer as células da planilha"""
+    larguras = []
+    for posicao, coluna in enumerate(df.columns):
+        maior = len(str(coluna))
+        if len(df):
+            maior = max(maior, int(df[coluna].astype(str).str.len().max()))
+        # Células vazias da linha de totais contam como 'None', como no ajuste célula a célula
+        maior = max(maior, len(str(valores_total[posicao])))
+        larguras.append(maior + 2)
+    return larguras
+
+def formatar_datas_exibicao(df):
+    """df com as colunas datetime64 em texto DD/MM/AAAA HH:MM (vazio se NaT), como o Excel sempre mostrou"""
+    if df is None:
+        return None
+    colunas = df.select_dtypes('datetime').columns
+    if not len(colunas):
+        return df
+    return df.assign(**{coluna: df[coluna].dt.strftime(FORMATO_DATA_NOTA).fillna('') for coluna in colunas})
+
+def escrever_aba_streaming(wb, titulo, df, nome_tabela, nome_coluna_total, coluna_valor):
+    """Escreve uma aba em modo write_only: cabeçalho, dados linha a linha, tabela e linha de TOTAL"""
+    ws = wb.create_sheet(titulo)
+    
+    # Linha de totais montada antes para entrar no cálculo das larguras
+    valores_total = [None] * len(df.columns)
+    valores_total[0] = 'TOTAL'
+    linha_total = list(valores_total)
+    
+    posicao_total = None
+    for idx, col_name in enumerate(df.columns):
+        if nome_coluna_total in col_name.upper():
+            posicao_total = idx
+            break
+    
+    if posicao_total is not None:
+        # Formatar rótulo e célula de total
+        celula_rotulo = WriteOnlyCell(ws, value='TOTAL')
+        celula_rotulo.font = Font(bold=True)
+        linha_total[0] = celula_rotulo
+        
+        valores_total[posicao_total] = total_em_reais(df[coluna_valor])
+        celula_total = WriteOnlyCell(ws, value=valores_total[posicao_total])
+        celula_total.font = Font(bold=True)
+        celula_total.alignment = Alignment(horizontal='right')
+        linha_total[posicao_total] = celula_total
+    
+    # No modo write_only as larguras precisam existir antes da primeira linha
+    for col_num, largura in enumerate(calcular_larguras_colunas(df, valores_total), 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = largura
+    
+    ws.append(list(df.columns))
+    for row_data in df.itertuples(index=False, name=None):
+        ws.append(row_data)
+    ws.append(linha_total)
+    
+    # Criar tabela (sem incluir a linha de totais)
+    ref = f"A1:{get_column_letter(len(df.columns))}{len(df) + 1}"
+    tabela = Table(displayName=nome_tabela, ref=ref)
+    tabela.tableStyleInfo = TableStyleInfo(
+        name="TableStyleMedium9",
+        showFirstColumn=False,
+        showLastColumn=False,
+        showRowStripes=True,
+        showColumnStripes=False
+    )
+    # Sem acesso às células já gravadas, as colunas da tabela vêm direto do DataFrame
+    tabela.tableColumns = [TableColumn(id=idx, name=str(col)) for idx, col in enumerate(df.columns, 1)]
+    tabela.autoFilter = AutoFilter(ref=ref)
+    # O openpyxl avisa em toda tabela write_only, mesmo com tableColumns já preenchido
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='In write-only mode you must add table columns manually')
+        ws.add_table(tabela)
+
+def criar_tabela_excel_streaming(df_xml, df_faturamento, caminho_excel, df_conciliacao=None, df_itens=None):
+    """Cria o mesmo Excel em modo write_only (memória limitada, uma passada pelos dados)"""
+    wb = Workbook(write_only=True)
+    
+    try:
+        if df_xml is not None:
+            escrever_aba_streaming(wb, "Notas Fiscais", df_xml, "TabelaNotasFiscais", 'VALOR XML', 'Valor XML')
+            print(f"✅ Tabela 'Notas Fiscais' criada com {len(df_xml)} registros")
+        
+        if df_faturamento is not None:
+            escrever_aba_streaming(wb, "Faturamento Bruto", df_faturamento, "TabelaFaturamento", 'FAT BRUTO', 'FAT BRUTO')
+            print(f"✅ Tabela 'Faturamento Bruto' criada com {len(df_faturamento)} registros")
+        
+        if df_conciliacao is not None:
+            escrever_aba_streaming(wb, "Conciliação", df_conciliacao, "TabelaConciliacao", 'DIFERENCA', 'DIFERENCA')
+            print(f"✅ Tabela 'Conciliação' criada com {len(df_conciliacao)} registros")
+        
+        if df_itens is not None:
+            escrever_aba_streaming(wb, "Itens", df_itens, "TabelaItens", 'DIFERENCA', 'DIFERENCA')
+            print(f"✅ Tabela 'Itens' criada com {len(df_itens)} registros")
+        
+        wb.save(caminho_excel)
+        print(f"✅ Arquivo salvo com tabelas e totais inseridos: {caminho_excel}")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Erro ao criar tabelas: {e}")
+        return False
+
+def criar_tabela_excel_com_formatacao(df_xml, df_faturamento, streaming=True, caminho_excel=None,
+                                      df_conciliacao=None, df_itens=None):
     """Cria arquivo Excel com tabelas reais inseridas e linhas de totais"""
-    downloads_path = str(Path.home() / "Downloads")
-    caminho_excel = os.path.join(downloads_path, "SISTEMA_X_XML.xlsx")
+    if caminho_excel is None:
+        downloads_path = str(Path.home() / "Downloads")
+        caminho_excel = os.path.join(downloads_path, "SISTEMA_X_XML.xlsx")
+    os.makedirs(os.path.dirname(caminho_excel) or '.', exist_ok=True)
+    
+    # DATA das notas é datetime64: na planilha continua o texto de sempre
+    df_xml = formatar_datas_exibicao(df_xml)
+    df_conciliacao = formatar_datas_exibicao(df_conciliacao)
+    
+    if streaming:
+        return criar_tabela_excel_streaming(df_xml, df_faturamento, caminho_excel, df_conciliacao, df_itens)
     
     # Criar workbook
     wb = Workbook()
@@ -534,7 +2237,7 @@ def criar_tabela_excel_com_formatacao(df_xml, df_faturamento):
             
             if valor_xml_col:
                 # Calcular total
-                total_valor_xml = df_xml['Valor XML'].sum()
+                total_valor_xml = total_em_reais(df_xml['Valor XML'])
                 ws_nf[f'{valor_xml_col}{total_row}'] = total_valor_xml
                 
                 # Formatar a célula de total
@@ -601,7 +2304,7 @@ def criar_tabela_excel_com_formatacao(df_xml, df_faturamento):
             
             if fat_bruto_col:
                 # Calcular total
-                total_fat_bruto = df_faturamento['FAT BRUTO'].sum()
+                total_fat_bruto = total_em_reais(df_faturamento['FAT BRUTO'])
                 ws_fat[f'{fat_bruto_col}{total_row}'] = total_fat_bruto
                 
                 # Formatar a célula de total
@@ -639,6 +2342,15 @@ def criar_tabela_excel_com_formatacao(df_xml, df_faturamento):
             
             print(f"✅ Tabela 'Faturamento Bruto' criada com {len(df_faturamento)} registros")
         
+        # ABA 3: CONCILIAÇÃO (mesmo formato da versão streaming)
+        if df_conciliacao is not None:
+            escrever_aba_streaming(wb, "Conciliação", df_conciliacao, "TabelaConciliacao", 'DIFERENCA', 'DIFERENCA')
+            print(f"✅ Tabela 'Conciliação' criada com {len(df_conciliacao)} registros")
+        
+        if df_itens is not None:
+            escrever_aba_streaming(wb, "Itens", df_itens, "TabelaItens", 'DIFERENCA', 'DIFERENCA')
+            print(f"✅ Tabela 'Itens' criada com {len(df_itens)} registros")
+        
         # Salvar arquivo
         wb.save(caminho_excel)
         print(f"✅ Arquivo salvo com tabelas e totais inseridos: {caminho_excel}")
@@ -648,47 +2360,558 @@ def criar_tabela_excel_com_formatacao(df_xml, df_faturamento):
         print(f"❌ Erro ao criar tabelas: {e}")
         return False
 
-def main():
-    """Função principal"""
-    print("=== SISTEMA X XML COM TABELAS E TOTAIS ===")
-    print("1. Processar XMLs de Notas Fiscais")
-    print("2. Processar Faturamento Bruto")
-    print("3. Processar Ambos")
+def exportar_dados_colunares(df_xml, df_faturamento, formatos, pasta_saida=None, df_conciliacao=None,
+                             df_itens=None):
+    """Grava df_xml e df_faturamento em Parquet e/ou CSV, ao lado do Excel"""
+    if pasta_saida is None:
+        pasta_saida = str(Path.home() / "Downloads")
+    os.makedirs(pasta_saida, exist_ok=True)
+    
+    formatos = list(formatos)
+    if 'parquet' in formatos and importlib.util.find_spec('pyarrow') is None:
+        print("⚠️ pyarrow não instalado - Parquet indisponível, gravando CSV no lugar")
+        formatos = [f for f in formatos if f != 'parquet']
+        if 'csv' not in formatos:
+            formatos.append('csv')
+    
+    arquivos_gerados = []
+    for nome, df in [("SISTEMA_X_XML_notas", df_xml), ("SISTEMA_X_XML_faturamento", df_faturamento),
+                     ("SISTEMA_X_XML_conciliacao", df_conciliacao), ("SISTEMA_X_XML_itens", df_itens)]:
+        if df is None:
+            continue
+        
+        for formato in formatos:
+            caminho = os.path.join(pasta_saida, f"{nome}.{formato}")
+            try:
+                if formato == 'parquet':
+                    df.to_parquet(caminho, engine='pyarrow', index=False)
+                else:
+                    formatar_datas_exibicao(df).to_csv(caminho, sep=';', decimal=',', index=False, encoding='utf-8')
+                arquivos_gerados.append(caminho)
+                print(f"✅ {len(df)} registros gravados em {caminho}")
+            except Exception as e:
+                print(f"❌ Erro ao gravar {caminho}: {e}")
+    
+    return arquivos_gerados
+
+def benchmark_conversores(linhas=1_000_000):
+    """Compara tempo e resultado dos conversores escalares (.apply) e vetorizados numa coluna sintética"""
+    rng = np.random.default_rng(0)
+    precos = rng.integers(0, 10_000_000, linhas) / 100
+    amostra = pd.Series([f"{v:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.') for v in precos], dtype=object)
+    # Sujeira típica do fechamento: vazios, NaN e texto
+    amostra[rng.random(linhas) < 0.01] = ''
+    amostra[rng.random(linhas) < 0.01] = np.nan
+    amostra[rng.random(linhas) < 0.001] = 'abc'
+    
+    print(f"⏱️ Benchmark dos conversores ({linhas:,} linhas)")
+    for nome, escalar, vetorizado in [('float', converter_para_float, converter_serie_para_float),
+                                      ('int', converter_para_int, converter_serie_para_int)]:
+        inicio = time.perf_counter()
+        esperado = amostra.apply(escalar)
+        tempo_escalar = time.perf_counter() - inicio
+        
+        inicio = time.perf_counter()
+        obtido = vetorizado(amostra)
+        tempo_vetorizado = time.perf_counter() - inicio
+        
+        identico = esperado.equals(obtido)
+        print(f"   {nome}: .apply {tempo_escalar:.2f}s | vetorizado {tempo_vetorizado:.2f}s | "
+              f"{tempo_escalar / tempo_vetorizado:.1f}x | {'✅ idêntico' if identico else '❌ divergente'}")
+
+def fotografar_pasta(caminho):
+    """{nome: (tamanho, mtime_ns)} dos arquivos da pasta; None se ela estiver inacessível"""
+    foto = {}
+    try:
+        with os.scandir(caminho) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        info = entry.stat()
+                        foto[entry.name] = (info.st_size, info.st_mtime_ns)
+                except OSError:
+                    continue  # Arquivo removido durante a listagem
+    except OSError:
+        return None
+    return foto
+
+def fotografar_pastas(pastas, threads=THREADS_LISTAGEM):
+    """fotografar_pasta de cada pasta, em paralelo; pasta inexistente vale como vazia"""
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(pastas) or 1))) as executor:
+        return {pasta: foto or {} for pasta, foto in zip(pastas, executor.map(fotografar_pasta, pastas))}
+
+def _atualizar_candidatos(estado, pasta, alterados, removidos):
+    """Relê data e chave dos XMLs novos/alterados da pasta; devolve quantos candidatos mudaram"""
+    candidatos = estado['candidatos'][pasta]
+    relevantes = 0
+    for nome in removidos:
+        caminho = os.path.join(pasta, nome)
+        estado['resultados'].pop(caminho, None)
+        estado['nnf'].pop(caminho, None)
+        if candidatos.pop(caminho, None) is not None:
+            relevantes += 1
+    
+    for nome in alterados:
+        if not nome.lower().endswith('.xml'):
+            continue
+        caminho = os.path.join(pasta, nome)
+        estado['resultados'].pop(caminho, None)
+        estado['nnf'].pop(caminho, None)
+        data_emissao, chave = extrair_data_e_chave_rapido_xml(caminho)
+        if data_emissao is not None and any(inicio <= data_emissao <= fim for inicio, fim in estado['periodos']):
+            candidatos[caminho] = (data_emissao, chave or nome)
+            relevantes += 1
+        elif candidatos.pop(caminho, None) is not None:
+            relevantes += 1
+    return relevantes
+
+def _atualizar_indice_eventos(indice_eventos, tipo, pasta, nome, existe):
+    """Inclui (existe=True) ou retira um arquivo de eventos/recusado do índice; devolve as NF-E afetadas"""
+    caminho = os.path.join(pasta, nome)
+    nome_minusculo = nome.lower()
+    # Conteúdo pode ter mudado: a classificação é refeita quando a nota for processada
+    indice_eventos['status'].pop(caminho, None)
+    
+    if tipo == 'recusado':
+        if not nome_minusculo.endswith('.txt'):
+            return set()
+        indice = indice_eventos['recusado']
+    elif nome_minusculo.endswith('.can'):
+        if existe:
+            indice_eventos['can'].add(nome_minusculo)
+        else:
+            indice_eventos['can'].discard(nome_minusculo)
+        return {nome_minusculo[:-len('.can')]}
+    elif nome_minusculo.endswith('.inu'):
+        indice = indice_eventos['inu']
+    else:
+        return set()
+    
+    chaves = _chaves_nfe_do_nome(nome)
+    for chave in chaves:
+        arquivos = indice.setdefault(chave, [])
+        if caminho in arquivos:
+            arquivos.remove(caminho)
+        if existe:
+            arquivos.append(caminho)
+    return chaves
+
+def _nnf_observado(estado, caminho):
+    """Número da nota de um XML já processado (do resultado ou, se ele não virou nota, do cabeçalho)"""
+    if caminho not in estado['resultados']:
+        return None  # Ainda será processado de qualquer forma
+    dados = estado['resultados'][caminho]
+    if dados:
+        return dados['NF-E']
+    if caminho not in estado['nnf']:
+        padrao = PADROES_CAMPOS_NFE['nNF']
+        try:
+            encontrado = padrao.search(ler_inicio_xml(caminho, padrao))
+            estado['nnf'][caminho] = int(encontrado.group(1)) if encontrado and encontrado.group(1) else None
+        except (OSError, ValueError):
+            estado['nnf'][caminho] = None
+    return estado['nnf'][caminho]
+
+def aplicar_mudancas_observadas(estado, pastas):
+    """Atualiza o estado com o que mudou desde a última fotografia; devolve quantas notas mudaram"""
+    relevantes = 0
+    nfes_afetadas = set()
+    for pasta in pastas:
+        foto = fotografar_pasta(pasta)
+        if foto is None:
+            continue  # Pasta inacessível agora (share fora do ar): vale o que já se sabia
+        anterior = estado['fotos'].get(pasta, {})
+        alterados = [nome for nome, assinatura in foto.items() if anterior.get(nome) != assinatura]
+        removidos = [nome for nome in anterior if nome not in foto]
+        estado['fotos'][pasta] = foto
+        
+        if pasta in estado['candidatos']:
+            relevantes += _atualizar_candidatos(estado, pasta, alterados, removidos)
+            continue
+        tipo = 'recusado' if pasta in estado['caminhos_recusado'] else 'eventos'
+        for nome in alterados:
+            nfes_afetadas |= _atualizar_indice_eventos(estado['indice_eventos'], tipo, pasta, nome, True)
+        for nome in removidos:
+            nfes_afetadas |= _atualizar_indice_eventos(estado['indice_eventos'], tipo, pasta, nome, False)
+    
+    afetadas = {int(nfe) for nfe in nfes_afetadas if nfe.isdigit()}
+    if afetadas:
+        for candidatos in estado['candidatos'].values():
+            for caminho in candidatos:
+                if _nnf_observado(estado, caminho) in afetadas:
+                    estado['resultados'].pop(caminho, None)
+                    relevantes += 1
+    return relevantes
+
+def montar_notas_observadas(estado, resumo):
+    """Notas atuais do modo observação (notas, itens); só os XMLs sem resultado são processados"""
+    notas_unicas = {}
+    selecionados, datas = [], []
+    for pasta in estado['caminhos_xml']:
+        for caminho, (data_emissao, chave) in estado['candidatos'][pasta].items():
+            if chave not in notas_unicas:
+                notas_unicas[chave] = caminho
+                selecionados.append(caminho)
+                datas.append(data_emissao)
+    
+    pendentes = [caminho for caminho in selecionados if caminho not in estado['resultados']]
+    if pendentes:
+        indice_eventos = estado['indice_eventos']
+        # Poucos arquivos por atualização: em série, sem o custo de subir o pool de processos
+        resultados = processar_arquivos_xml(pendentes, indice_eventos['can'], estado['caminhos_recusado'],
+                                            estado['caminhos_eventos'], indice_eventos, 1, estado['itens'])
+        estado['resultados'].update((caminho, dados) for caminho, dados in zip(pendentes, resultados)
+                                    if dados is not False)
     
-    opcao = input("Escolha uma opção (1/2/3): ").strip()
+    notas, df_itens = _acumular_resultados(datas, [estado['resultados'].get(caminho) for caminho in selecionados],
+                                           estado['itens'])
+    print(f"👀 {len(pendentes)} XMLs processados | {notas['tamanho']} notas | R$ {notas['total'] / 100:,.2f}")
+    resumo['notas_processadas'] = notas['tamanho']
+    resumo['valor_total'] = notas['total'] / 100
+    if df_itens is not None:
+        resumo['itens'] = len(df_itens)
+    
+    if not notas['tamanho']:
+        return None, df_itens
+    if estado['por_periodo']:
+        return separar_notas_por_periodo(notas, estado['periodos'], resumo), df_itens
+    return df_acumulador_notas(notas).sort_values('NF-E', kind='mergesort'), df_itens
+
+def iniciar_notificacoes(pastas, fila):
+    """Observador watchdog que põe na fila a pasta de cada mudança; None sem watchdog"""
+    if importlib.util.find_spec('watchdog') is None:
+        print("ℹ️ watchdog não instalado - pastas verificadas periodicamente")
+        return None
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    
+    observador = Observer()
+    try:
+        for pasta in pastas:
+            if not os.path.isdir(pasta):
+                continue  # Pasta criada depois aparece na varredura completa
+            tratador = FileSystemEventHandler()
+            # Leituras do próprio programa (abrir/fechar sem gravar) não contam como mudança
+            tratador.on_any_event = lambda evento, pasta=pasta: (
+                evento.event_type in ('opened', 'closed_no_write') or fila.put(pasta))
+            observador.schedule(tratador, pasta, recursive=False)
+        observador.start()
+    except Exception as e:
+        print(f"⚠️ Notificações do sistema indisponíveis ({e}) - pastas verificadas periodicamente")
+        return None
+    return observador
+
+def observar_notas(estado, atualizar_saidas, intervalo=INTERVALO_OBSERVACAO, espera_gravacao=ESPERA_GRAVACAO,
+                   minutos=0, notificacoes=True):
+    """Modo observação: atualiza as saídas quando as pastas mudam; devolve quantas atualizações houve"""
+    pastas = estado['caminhos_xml'] + estado['caminhos_eventos'] + estado['caminhos_recusado']
+    fila = queue.Queue()
+    observador = iniciar_notificacoes(pastas, fila) if notificacoes else None
+    modo = "notificações do sistema" if observador is not None else f"verificação a cada {intervalo:g}s"
+    print(f"\n👀 Observando {len(pastas)} pastas ({modo}) - Ctrl+C para encerrar")
+    
+    fim = time.monotonic() + minutos * 60 if minutos else None
+    ultima_varredura = time.monotonic()
+    ultima_mudanca = None  # Mudanças ainda não gravadas
+    atualizacoes = 0
+    try:
+        while fim is None or time.monotonic() < fim:
+            espera = intervalo
+            if ultima_mudanca is not None:
+                espera = min(espera, ultima_mudanca + espera_gravacao - time.monotonic())
+            if fim is not None:
+                espera = min(espera, fim - time.monotonic())
+            espera = max(0.0, espera)
+            
+            if observador is None:
+                time.sleep(espera)
+                alteradas = pastas
+            else:
+                alteradas = set()
+                try:
+                    alteradas.add(fila.get(timeout=espera))
+                    while True:
+                        alteradas.add(fila.get_nowait())
+                except queue.Empty:
+                    pass
+                if time.monotonic() - ultima_varredura >= VARREDURA_COMPLETA_OBSERVACAO:
+                    alteradas = pastas
+                    ultima_varredura = time.monotonic()
+            
+            if alteradas:
+                relevantes = aplicar_mudancas_observadas(estado, alteradas)
+                if relevantes:
+                    print(f"🆕 {relevantes} XMLs/notas afetados - saídas atualizadas após {espera_gravacao:g}s sem mudanças")
+                    ultima_mudanca = time.monotonic()
+            
+            if ultima_mudanca is not None and time.monotonic() - ultima_mudanca >= espera_gravacao:
+                atualizar_saidas()
+                atualizacoes += 1
+                ultima_mudanca = None
+    except KeyboardInterrupt:
+        print("\n⏹️ Observação encerrada")
+    finally:
+        if observador is not None:
+            observador.stop()
+            observador.join()
+    
+    if ultima_mudanca is not None:
+        atualizar_saidas()
+        atualizacoes += 1
+    return atualizacoes
+
+def conciliar_e_exportar(df_xml, df_faturamento, df_itens, resumo, formatos=('excel',), excel_streaming=True,
+                         pasta_saida=None, tolerancia=TOLERANCIA_CONCILIACAO):
+    """Concilia XMLs x faturamento e grava as saídas: True, False em erro ou None sem dados"""
+    if df_xml is None and df_faturamento is None:
+        print("❌ Nenhum dado foi processado.")
+        return None
+    
+    df_conciliacao = None
+    if df_xml is not None and df_faturamento is not None:
+        print("\n🔗 Conciliando Sistema x XML...")
+        inicio_conciliacao = time.perf_counter()
+        if 'PERIODO' in df_xml.columns:
+            # Uma conciliação por período (a mesma nota pode estar em mais de um)
+            # e com o faturamento recortado ao período (notas do mês fora dele não viram SÓ SISTEMA)
+            partes = []
+            for periodo, df_periodo in df_xml.groupby('PERIODO', sort=False):
+                faturamento_periodo = faturamento_do_periodo(df_faturamento, periodo, df_periodo['NF-E'])
+                parte = conciliar_sistema_xml(df_periodo.drop(columns='PERIODO'), faturamento_periodo, tolerancia)
+                if parte is not None:
+                    parte.insert(0, 'PERIODO', periodo)
+                    partes.append(parte)
+            df_conciliacao = pd.concat(partes, ignore_index=True) if partes else None
+        else:
+            df_conciliacao = conciliar_sistema_xml(df_xml, df_faturamento, tolerancia)
+        registrar_etapa('conciliacao', time.perf_counter() - inicio_conciliacao, len(df_xml))
+        if df_conciliacao is not None:
+            resumo['conciliacao'] = {situacao: int(quantidade) for situacao, quantidade
+                                     in df_conciliacao['SITUACAO'].value_counts().items()}
+    
+    df_conciliacao_itens = None
+    if df_xml is not None and df_itens is not None and df_faturamento is not None:
+        print("\n🔗 Conciliando itens (NF-E + produto)...")
+        with medir_etapa('conciliacao_itens') as contagem:
+            contagem['itens'] = len(df_itens)
+            if 'PERIODO' in df_xml.columns:
+                # Itens das notas de cada período, como na conciliação por NF-E
+                partes = []
+                for periodo, df_periodo in df_xml.groupby('PERIODO', sort=False):
+                    faturamento_periodo = faturamento_do_periodo(df_faturamento, periodo, df_periodo['NF-E'])
+                    parte = conciliar_itens_xml(df_itens[df_itens['NF-E'].isin(df_periodo['NF-E'])],
+                                                faturamento_periodo, tolerancia)
+                    if parte is not None:
+                        parte.insert(0, 'PERIODO', periodo)
+                        partes.append(parte)
+                df_conciliacao_itens = pd.concat(partes, ignore_index=True) if partes else None
+            else:
+                df_conciliacao_itens = conciliar_itens_xml(df_itens, df_faturamento, tolerancia)
+        if df_conciliacao_itens is not None:
+            resumo['conciliacao_itens'] = {situacao: int(quantidade) for situacao, quantidade
+                                           in df_conciliacao_itens['SITUACAO'].value_counts().items()}
+    
+    resumo['arquivos_gerados'] = []
+    sucesso = True
+    if 'excel' in formatos:
+        caminho_excel = os.path.join(pasta_saida, "SISTEMA_X_XML.xlsx") if pasta_saida else None
+        with medir_etapa('excel') as contagem:
+            sucesso = criar_tabela_excel_com_formatacao(df_xml, df_faturamento, streaming=excel_streaming,
+                                                        caminho_excel=caminho_excel, df_conciliacao=df_conciliacao,
+                                                        df_itens=df_conciliacao_itens)
+            contagem['itens'] = sum(len(df) for df in (df_xml, df_faturamento, df_conciliacao, df_conciliacao_itens)
+                                    if df is not None)
+        if sucesso:
+            resumo['arquivos_gerados'].append(
+                caminho_excel or os.path.join(str(Path.home() / "Downloads"), "SISTEMA_X_XML.xlsx"))
+    
+    formatos_colunares = [f for f in formatos if f in ('parquet', 'csv')]
+    if formatos_colunares:
+        with medir_etapa('exportacao_colunar') as contagem:
+            gerados = exportar_dados_colunares(df_xml, df_faturamento, formatos_colunares,
+                                               pasta_saida, df_conciliacao, df_conciliacao_itens)
+            contagem['itens'] = len(gerados)
+        resumo['arquivos_gerados'] += gerados
+    
+    if sucesso:
+        # Estatísticas
+        if df_xml is not None:
+            total_valor_xml = total_em_reais(df_xml['Valor XML'])
+            print(f"📊 Notas Fiscais: {len(df_xml)} registros | Total: R$ {total_valor_xml:,.2f}")
+        
+        if df_faturamento is not None:
+            total_fat_bruto = total_em_reais(df_faturamento['FAT BRUTO']) if 'FAT BRUTO' in df_faturamento.columns else 0
+            print(f"📊 Faturamento Bruto: {len(df_faturamento)} registros | Total: R$ {total_fat_bruto:,.2f}")
+            resumo['faturamento']['fat_bruto'] = total_fat_bruto
+    return sucesso
+
+def main(opcao=None, data_inicial=None, data_final=None, periodos=None, itens=False, opcoes_xml=None,
+         opcoes_faturamento=None, opcoes_saida=None, opcoes_observacao=None):
+    """Função principal; opcoes_* vão para a busca dos XMLs, o faturamento, conciliar_e_exportar e observar_notas"""
+    inicio = time.perf_counter()
+    resumo = {'status': 'erro', 'arquivos_gerados': []}
+    iniciar_metricas()
+    opcoes_xml = dict(opcoes_xml or {})
+    opcoes_faturamento = {'pasta_cache_csv': PASTA_CACHE_CSV, **(opcoes_faturamento or {})}
+    opcoes_saida = opcoes_saida or {}
+    
+    print("=== SISTEMA X XML COM TABELAS E TOTAIS ===")
+    if opcao is None:
+        print("1. Processar XMLs de Notas Fiscais")
+        print("2. Processar Faturamento Bruto")
+        print("3. Processar Ambos")
+        
+        opcao = input("Escolha uma opção (1/2/3): ").strip()
+        
+        if opcoes_xml.get('workers') is None and opcao in ['1', '3']:
+            resposta = input("Processos para leitura dos XMLs (Enter = 1, 0 = todos os núcleos): ").strip()
+            opcoes_xml['workers'] = int(resposta) if resposta.lstrip('-').isdigit() else 1
+    resumo['opcao'] = opcao
     
     df_xml = None
     df_faturamento = None
     
+    if itens and opcao != '3':
+        print("⚠️ Itens só são conciliados com XMLs e faturamento (opção 3) - ignorando")
+        itens = False
+    detalhe = {} if itens else None
+    
+    if opcoes_observacao is not None and opcao not in ['1', '3']:
+        print("⚠️ Modo observação acompanha os XMLs (opções 1 e 3) - ignorando")
+        opcoes_observacao = None
+    estado = None
+    if opcoes_observacao is not None:
+        # Fotografia antes da primeira varredura: o que chegar durante ela aparece na primeira verificação
+        pastas = [pasta for caminhos in montar_caminhos_nfe(opcoes_xml.get('raizes') or RAIZES_NFE) for pasta in caminhos]
+        estado = {'fotos': fotografar_pastas(pastas, opcoes_xml.get('threads_listagem', THREADS_LISTAGEM))}
+    
     if opcao in ['1', '3']:
         print("\n📁 Processando XMLs...")
-        df_xml = buscar_xml_por_data()
+        resumo['notas'] = {}
+        if periodos:
+            df_xml = buscar_xml_por_periodos(periodos, resumo=resumo['notas'], detalhe=detalhe, estado=estado,
+                                             **opcoes_xml)
+        else:
+            df_xml = buscar_xml_por_data(data_inicial=data_inicial, data_final=data_final, resumo=resumo['notas'],
+                                         detalhe=detalhe, estado=estado, **opcoes_xml)
     
     if opcao in ['2', '3']:
         print("\n📊 Processando Faturamento...")
-        df_faturamento = processar_faturamento_bruto()
+        df_faturamento = processar_faturamento_bruto(**opcoes_faturamento)
+        resumo['faturamento'] = {'linhas': 0 if df_faturamento is None else len(df_faturamento)}
     
-    if df_xml is not None or df_faturamento is not None:
-        sucesso = criar_tabela_excel_com_formatacao(df_xml, df_faturamento)
-        
-        if sucesso:
-            # Estatísticas
-            if df_xml is not None:
-                total_valor_xml = df_xml['Valor XML'].sum()
-                print(f"📊 Notas Fiscais: {len(df_xml)} registros | Total: R$ {total_valor_xml:,.2f}")
-            
-            if df_faturamento is not None:
-                total_fat_bruto = df_faturamento['FAT BRUTO'].sum() if 'FAT BRUTO' in df_faturamento.columns else 0
-                print(f"📊 Faturamento Bruto: {len(df_faturamento)} registros | Total: R$ {total_fat_bruto:,.2f}")
-            
+    sucesso = conciliar_e_exportar(df_xml, df_faturamento, detalhe.get('itens') if detalhe else None, resumo,
+                                   **opcoes_saida)
+    if sucesso is None:
+        resumo['status'] = 'sem_dados'
+    elif sucesso:
+        resumo['status'] = 'ok'
+        if 'excel' in opcoes_saida.get('formatos', ('excel',)):
             print("\n💡 DICA: Ao abrir o Excel, você verá:")
             print("   • Tabelas formatadas com filtros automáticos")
             print("   • Linha de totais abaixo de cada tabela")
             print("   • Formatação em negrito para os totais")
+    else:
+        print("❌ Erro ao criar arquivo com tabelas.")
+    
+    if estado is not None:
+        if 'indice_eventos' not in estado:
+            print("❌ Modo observação sem pastas de XML acessíveis - encerrando")
+        else:
+            def atualizar_saidas():
+                df_xml_atual, df_itens_atual = montar_notas_observadas(estado, resumo['notas'])
+                if conciliar_e_exportar(df_xml_atual, df_faturamento, df_itens_atual, resumo, **opcoes_saida):
+                    resumo['status'] = 'ok'
+            
+            resumo['observacao'] = {'atualizacoes': observar_notas(estado, atualizar_saidas, **opcoes_observacao)}
+    
+    resumo['duracao_s'] = round(time.perf_counter() - inicio, 3)
+    resumo['etapas_s'] = {nome: etapa['segundos'] for nome, etapa in relatorio_metricas()['etapas'].items()}
+    return resumo
+
+def gravar_relatorio_desempenho(destino, perfil=None, caminho_perfil=None):
+    """Grava o relatório de desempenho em JSON e, com cProfile, as estatísticas (.prof + 20 funções mais caras)"""
+    relatorio = relatorio_metricas()
+    if perfil is not None and caminho_perfil:
+        os.makedirs(os.path.dirname(caminho_perfil) or '.', exist_ok=True)
+        perfil.dump_stats(caminho_perfil)
+        texto = io.StringIO()
+        pstats.Stats(perfil, stream=texto).sort_stats('cumulative').print_stats(20)
+        relatorio['cprofile'] = {'arquivo': caminho_perfil, 'top_cumulativo': texto.getvalue()}
+        print(f"✅ Perfil cProfile gravado em {caminho_perfil} (abra com: python -m pstats {caminho_perfil})")
+    if destino:
+        os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+        with open(destino, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"✅ Relatório de desempenho gravado em {destino}")
+    return relatorio
+
+def carregar_config(caminho_config):
+    """Lê o arquivo JSON de configuração (chaves = nomes das opções, com _ no lugar de -)"""
+    with open(caminho_config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return {chave.replace('-', '_'): valor for chave, valor in config.items()}
+
+def validar_config(parser, config, origem):
+    """Valores do JSON passados pelos mesmos type/choices da linha de comando (parser.error se inválidos)"""
+    # Aceita o nome da opção (csv_em_blocos) ou o destino (tamanho_bloco_csv)
+    acoes = {acao.dest: acao for acao in parser._actions}
+    for acao in parser._actions:
+        for opcao in acao.option_strings:
+            acoes.setdefault(opcao.lstrip('-').replace('-', '_'), acao)
+    desconhecidas = sorted(set(config) - set(acoes))
+    if desconhecidas:
+        parser.error(f"opções desconhecidas em {origem}: {', '.join(desconhecidas)}")
+    
+    def converter(chave, acao, valor):
+        # JSON pode trazer número onde a linha de comando teria texto (ex.: "opcao": 2)
+        if isinstance(valor, (bool, list, dict)) or valor is None:
+            parser.error(f"{origem}: valor inválido para '{chave}': {valor!r}")
+        try:
+            convertido = acao.type(str(valor)) if acao.type else str(valor)
+        except (TypeError, ValueError):
+            parser.error(f"{origem}: valor inválido para '{chave}': {valor!r}")
+        if acao.choices is not None and convertido not in acao.choices:
+            parser.error(f"{origem}: '{chave}' deve ser um de {', '.join(map(str, acao.choices))} (veio {valor!r})")
+        return convertido
+    
+    def converter_lista(chave, acao, valor, tamanho=None):
+        valores = valor if isinstance(valor, list) else [valor]
+        if tamanho is not None and len(valores) != tamanho:
+            parser.error(f"{origem}: '{chave}' espera {tamanho} valores por item (veio {valor!r})")
+        return [converter(chave, acao, item) for item in valores]
+    
+    validado = {}
+    for chave, valor in config.items():
+        acao = acoes[chave]
+        if valor is None:
+            validado[acao.dest] = None
+        elif acao.nargs == 0:
+            # store_true: só true/false
+            if not isinstance(valor, bool):
+                parser.error(f"{origem}: '{chave}' deve ser true ou false (veio {valor!r})")
+            validado[acao.dest] = valor
+        elif isinstance(acao, argparse._AppendAction):
+            if not isinstance(valor, list):
+                parser.error(f"{origem}: '{chave}' deve ser uma lista (veio {valor!r})")
+            tamanho = acao.nargs if isinstance(acao.nargs, int) else None
+            validado[acao.dest] = [converter_lista(chave, acao, item, tamanho) if tamanho else converter(chave, acao, item)
+                                 for item in valor]
+        elif acao.nargs in ('+', '*'):
+            validado[acao.dest] = converter_lista(chave, acao, valor)
         else:
-            print("❌ Erro ao criar arquivo com tabelas.")
+            validado[acao.dest] = converter(chave, acao, valor)
+    return validado
+
+def gravar_resumo(resumo, destino):
+    """Grava o resumo da execução em JSON ('-' = última linha da saída padrão)"""
+    if destino == '-':
+        print(json.dumps(resumo, ensure_ascii=False, default=str))
     else:
-        print("❌ Nenhum dado foi processado.")
+        texto = json.dumps(resumo, ensure_ascii=False, indent=2, default=str)
+        os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+        with open(destino, 'w', encoding='utf-8') as f:
+            f.write(texto)
 
 if __name__ == "__main__":
     # Verificar dependências
@@ -714,5 +2937,121 @@ if __name__ == "__main__":
         subprocess.check_call(["pip", "install", "chardet"])
         import chardet
     
-    main()
-    input("\nPressione Enter para sair...")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sistema x XML com tabelas e totais")
+    parser.add_argument('--config', metavar='ARQUIVO.json',
+                        help="arquivo JSON com as opções abaixo (a linha de comando tem precedência)")
+    parser.add_argument('--opcao', choices=['1', '2', '3'], default=None,
+                        help="1 = XMLs, 2 = faturamento, 3 = ambos; informada, roda em lote sem perguntas")
+    parser.add_argument('--data-inicial', metavar='DD/MM/AAAA', help="início do período dos XMLs")
+    parser.add_argument('--data-final', metavar='DD/MM/AAAA', help="fim do período dos XMLs")
+    parser.add_argument('--periodo', nargs=2, action='append', metavar=('INICIAL', 'FINAL'), dest='periodos',
+                        help="período DD/MM/AAAA DD/MM/AAAA; repita para vários (uma varredura só, coluna PERIODO)")
+    parser.add_argument('--raizes', nargs='+', metavar='PASTA', default=None,
+                        help=f"raízes das NF-e (padrão: {' '.join(RAIZES_NFE)})")
+    parser.add_argument('--fechamento', metavar='CSV', help="CSV de fechamento do faturamento")
+    parser.add_argument('--cancelados', metavar='CSV', help="CSV das notas canceladas")
+    parser.add_argument('--historico-csv', metavar='CSV', help="CSV do histórico (peso por produto)")
+    parser.add_argument('--saida', metavar='PASTA', default=None,
+                        help="pasta das planilhas e arquivos gerados (padrão: Downloads)")
+    parser.add_argument('--indice', metavar='ARQUIVO', default=CAMINHO_INDICE_NFE,
+                        help="índice SQLite dos cabeçalhos (use um por job em execuções simultâneas)")
+    parser.add_argument('--sem-indice', action='store_true',
+                        help="não usa o índice SQLite: lê o cabeçalho de cada XML")
+    parser.add_argument('--resumo-json', metavar='ARQUIVO',
+                        help="grava o resumo da execução em JSON ('-' = saída padrão)")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_CONCILIACAO,
+                        help=f"diferença aceita (R$) na conciliação por NF-E (padrão {TOLERANCIA_CONCILIACAO})")
+    parser.add_argument('--itens', action='store_true',
+                        help="opção 3: lê os itens (det/prod) dos XMLs e concilia por NF-E + produto (aba Itens)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processos para leitura dos XMLs (0 = todos os núcleos)")
+    parser.add_argument('--historico', choices=['vetorizado', 'iterativo', 'comparar'], default='vetorizado',
+                        help="forma de aplicar o histórico ao faturamento ('comparar' executa as duas)")
+    parser.add_argument('--csv-em-blocos', type=int, nargs='?', const=TAMANHO_BLOCO_CSV, default=None,
+                        metavar='LINHAS', dest='tamanho_bloco_csv',
+                        help=f"lê fechamento e histórico em blocos (padrão {TAMANHO_BLOCO_CSV} linhas), "
+                             "só com as colunas usadas e tipos compactos")
+    parser.add_argument('--cache-csv', metavar='PASTA', default=PASTA_CACHE_CSV,
+                        help="pasta do cache dos CSVs já convertidos (Parquet, reaproveitado enquanto o CSV não muda)")
+    parser.add_argument('--sem-cache-csv', action='store_true',
+                        help="sempre lê e converte os CSVs do faturamento")
+    parser.add_argument('--limite-cache-csv', type=int, default=LIMITE_CACHE_CSV_MB, metavar='MB',
+                        help=f"tamanho máximo do cache de CSVs; os menos usados saem primeiro (padrão {LIMITE_CACHE_CSV_MB})")
+    parser.add_argument('--excel-em-memoria', action='store_true',
+                        help="monta o Excel inteiro em memória (modo antigo) em vez do modo streaming")
+    parser.add_argument('--formatos', nargs='+', choices=['excel', 'parquet', 'csv'], default=['excel'],
+                        help="saídas a gerar (ex.: --formatos parquet csv pula o Excel)")
+    parser.add_argument('--observar', type=float, nargs='?', const=INTERVALO_OBSERVACAO, default=None,
+                        metavar='SEGUNDOS',
+                        help="depois da primeira execução, acompanha XMLs, eventos e recusado e atualiza as saídas "
+                             f"quando algo muda (verificação a cada {INTERVALO_OBSERVACAO}s; Ctrl+C encerra)")
+    parser.add_argument('--espera-gravacao', type=float, default=ESPERA_GRAVACAO, metavar='SEGUNDOS',
+                        help=f"modo observação: segundos sem mudanças antes de atualizar as saídas (padrão {ESPERA_GRAVACAO})")
+    parser.add_argument('--observar-minutos', type=float, default=0, metavar='MIN',
+                        help="modo observação: encerra depois de MIN minutos (padrão 0 = só com Ctrl+C)")
+    parser.add_argument('--sem-notificacao', action='store_true',
+                        help="modo observação: não usa as notificações do sistema (watchdog), só a verificação periódica")
+    parser.add_argument('--incremental', action='store_true',
+                        help="reaproveita os resultados da execução anterior e só processa XMLs/eventos novos")
+    parser.add_argument('--threads-listagem', type=int, default=THREADS_LISTAGEM,
+                        help=f"threads para listar as pastas e ler cabeçalhos no drive de rede (padrão {THREADS_LISTAGEM})")
+    parser.add_argument('--relatorio-desempenho', metavar='ARQUIVO.json',
+                        help="grava tempo, arquivos e bytes por etapa e os XMLs mais lentos em JSON")
+    parser.add_argument('--cprofile', metavar='ARQUIVO.prof',
+                        help="executa sob cProfile e grava as estatísticas (entra no relatório de desempenho)")
+    parser.add_argument('--verificar-extrator', nargs='+', metavar='PASTA',
+                        help="confere o extrator de campos por bytes contra o parse completo e sai")
+    parser.add_argument('--benchmark-conversores', action='store_true',
+                        help="mede os conversores numéricos em 1 milhão de linhas e sai")
+    
+    # Valores do arquivo de configuração viram padrões; a linha de comando continua valendo
+    args_config, _ = parser.parse_known_args()
+    if args_config.config:
+        config = validar_config(parser, carregar_config(args_config.config), args_config.config)
+        parser.set_defaults(**config)
+    args = parser.parse_args()
+    
+    if args.verificar_extrator:
+        sys.exit(0 if verificar_extrator_xml(args.verificar_extrator) else 1)
+    
+    if args.benchmark_conversores:
+        benchmark_conversores()
+        sys.exit(0)
+    
+    lote = args.opcao is not None
+    if lote and args.opcao in ['1', '3'] and not (args.data_inicial and args.data_final) and not args.periodos:
+        parser.error("--opcao 1/3 em lote exige --data-inicial e --data-final (ou --periodo)")
+    if lote and args.workers is None:
+        args.workers = 1
+    
+    perfil = cProfile.Profile() if args.cprofile else None
+    if perfil is not None:
+        perfil.enable()
+    opcoes_xml = {'caminho_indice': None if args.sem_indice else args.indice, 'workers': args.workers,
+                  'incremental': args.incremental, 'threads_listagem': args.threads_listagem, 'raizes': args.raizes}
+    opcoes_faturamento = {'modo_historico': args.historico, 'caminho_fechamento': args.fechamento,
+                          'caminho_cancelados': args.cancelados, 'caminho_historico': args.historico_csv,
+                          'tamanho_bloco': args.tamanho_bloco_csv,
+                          'pasta_cache_csv': None if args.sem_cache_csv else args.cache_csv,
+                          'limite_cache_csv_mb': args.limite_cache_csv}
+    opcoes_saida = {'formatos': args.formatos, 'excel_streaming': not args.excel_em_memoria,
+                    'pasta_saida': args.saida, 'tolerancia': args.tolerancia}
+    opcoes_observacao = None if not args.observar else {
+        'intervalo': args.observar, 'espera_gravacao': args.espera_gravacao, 'minutos': args.observar_minutos,
+        'notificacoes': not args.sem_notificacao}
+    resumo = main(opcao=args.opcao, data_inicial=args.data_inicial, data_final=args.data_final,
+                  periodos=args.periodos, itens=args.itens, opcoes_xml=opcoes_xml,
+                  opcoes_faturamento=opcoes_faturamento, opcoes_saida=opcoes_saida,
+                  opcoes_observacao=opcoes_observacao)
+    if perfil is not None:
+        perfil.disable()
+    
+    if args.relatorio_desempenho or perfil is not None:
+        gravar_relatorio_desempenho(args.relatorio_desempenho, perfil, args.cprofile)
+    
+    if args.resumo_json:
+        gravar_resumo(resumo, args.resumo_json)
+    
+    if lote:
+        sys.exit(0 if resumo['status'] == 'ok' else 1)
+    input("\nPressione Enter para sair...")
@@ -0,0 +1,38 @@
+from datetime import date
+from pathlib import Path
+
+import sistem_vs_xml as sx
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'xml'
+
+
+def nota(nfe, obs=None):
+    return {'CF': 'VENDA', 'Romaneio': nfe, 'NF-E': nfe, 'Centavos XML': 100 * nfe, 'DATA': '02/05/2026 10:00',
+            'OBS': obs, '_itens': [('100', 1.0, nfe, nfe)]}
+
+
+def test_acumulador_cresce_lote_a_lote_como_numa_gravacao_unica():
+    resultados = [nota(nfe, obs='CANCELADA' if nfe % 5 == 0 else None) if nfe % 3 else None for nfe in range(1, 41)]
+    datas = [date(2026, 5, 2)] * len(resultados)
+
+    notas = sx.criar_acumulador_notas(1)
+    itens_nfe = []
+    for inicio in range(0, len(resultados), 7):
+        sx._acumular_lote(notas, itens_nfe, datas[inicio:inicio + 7], resultados[inicio:inicio + 7])
+    assert len(notas['nfe']) > 1  # capacidade dobrada durante o acúmulo
+
+    esperado, df_itens = sx._acumular_resultados(datas, resultados, True)
+    assert notas['tamanho'] == esperado['tamanho'] == 27
+    assert notas['total'] == esperado['total']
+    assert sx.df_acumulador_notas(notas).equals(sx.df_acumulador_notas(esperado))
+    assert sx.montar_df_itens(itens_nfe).equals(df_itens)
+
+
+def test_processar_arquivos_xml_entrega_os_lotes_na_ordem(monkeypatch):
+    monkeypatch.setattr(sx, 'TAMANHO_LOTE_XML', 2)
+    arquivos = sorted(str(caminho) for caminho in FIXTURES.glob('*.xml'))
+    lotes = []
+    sobra = sx.processar_arquivos_xml(arquivos, set(), [], [], None, 1, ao_processar=lambda lote: lotes.append(lote))
+    assert sobra == []
+    assert [len(lote) for lote in lotes] == [2, 2, 1]
+    assert [dados for lote in lotes for dados in lote] == sx.processar_arquivos_xml(arquivos, set(), [], [], None, 1)
@@ -0,0 +1,28 @@
+import pandas as pd
+
+import sistem_vs_xml as sx
+
+
+def test_cprod_alfanumerico_nao_cruza_com_produto_do_fechamento():
+    df_itens = sx.montar_df_itens([(10, '100', 1.0, 50.0, 50.0), (10, 'P-100', 2.0, 5.0, 10.0),
+                                   (10, '200', 1.0, 7.0, 7.0)])
+    assert df_itens['CODPRODUTO'].tolist() == [100, 0, 200]
+
+    df_faturamento = pd.DataFrame({'NF-E': [10, 10], 'CODPRODUTO': [100, 200], 'FAT BRUTO': [50.0, 7.0]})
+    df_conciliacao = sx.conciliar_itens_xml(df_itens, df_faturamento)
+    assert df_conciliacao[['CODPRODUTO', 'SITUACAO']].values.tolist() == [[100, 'OK'], [200, 'OK']]
+
+
+def test_conciliacao_por_periodo_usa_so_o_faturamento_do_periodo(tmp_path):
+    df_xml = pd.DataFrame({'PERIODO': ['01/05/2026 a 07/05/2026', '08/05/2026 a 13/05/2026'],
+                           'CF': ['VENDA', 'VENDA'], 'Romaneio': [1, 2], 'NF-E': [10, 20],
+                           'Valor XML': [50.0, 70.0],
+                           'DATA': pd.to_datetime(['02/05/2026 10:00', '09/05/2026 10:00'], format='%d/%m/%Y %H:%M'),
+                           'OBS': ['', '']})
+    # NF-E 20 tem DATA do faturamento fora do período do XML: casa no seu período e é só sistema no outro
+    df_faturamento = pd.DataFrame({'NF-E': [10, 20, 30, 40], 'ROMANEIO': [1, 2, 3, 4],
+                                   'DATA': ['02/05/2026', '07/05/2026', '05/05/2026', '12/05/2026'],
+                                   'FAT BRUTO': [50.0, 70.0, 10.0, 20.0]})
+    resumo = {'faturamento': {}}
+    assert sx.conciliar_e_exportar(df_xml, df_faturamento, None, resumo, formatos=('csv',), pasta_saida=str(tmp_path))
+    assert resumo['conciliacao'] == {'OK': 2, 'SÓ SISTEMA': 3}
@@ -0,0 +1,39 @@
+import argparse
+
+import pytest
+
+import sistem_vs_xml as sx
+
+
+def criar_parser():
+    # Mesmo formato das opções do script (type/choices/nargs/append/store_true)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--opcao', choices=['1', '2', '3'], default=None)
+    parser.add_argument('--periodo', nargs=2, action='append', dest='periodos')
+    parser.add_argument('--tolerancia', type=float, default=0.01)
+    parser.add_argument('--itens', action='store_true')
+    parser.add_argument('--csv-em-blocos', type=int, nargs='?', const=100, dest='tamanho_bloco_csv')
+    parser.add_argument('--formatos', nargs='+', choices=['excel', 'parquet', 'csv'], default=['excel'])
+    return parser
+
+
+def test_config_converte_valores_como_a_linha_de_comando():
+    config = {'opcao': 2, 'tolerancia': 1, 'itens': True, 'csv_em_blocos': 500, 'formatos': 'csv',
+              'periodos': [['01/05/2026', '07/05/2026']]}
+    validado = sx.validar_config(criar_parser(), config, 'cfg.json')
+    assert validado == {'opcao': '2', 'tolerancia': 1.0, 'itens': True, 'tamanho_bloco_csv': 500,
+                        'formatos': ['csv'], 'periodos': [['01/05/2026', '07/05/2026']]}
+
+
+@pytest.mark.parametrize('config', [
+    {'opcao': 4},
+    {'tolerancia': 'abc'},
+    {'itens': 'sim'},
+    {'formatos': ['xlsx']},
+    {'periodos': [['01/05/2026']]},
+    {'opcao_desconhecida': 1},
+])
+def test_config_invalida_para_com_erro_do_parser(config):
+    with pytest.raises(SystemExit) as erro:
+        sx.validar_config(criar_parser(), config, 'cfg.json')
+    assert erro.value.code == 2
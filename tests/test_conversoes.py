@@ -0,0 +1,32 @@
+import pandas as pd
+
+import sistem_vs_xml as sx
+
+
+def test_converter_serie_para_int_valor_fora_do_int64_vira_zero():
+    chave = '35260512345678000199550010000000041000050040'
+    serie = pd.Series(['123', chave, '1000000000000000000', '9223372036854775808', '1.234,56', 'NF 77', None])
+    resultado = sx.converter_serie_para_int(serie)
+    assert resultado.dtype == 'int64'
+    assert resultado.tolist() == [123, 0, 10**18, 0, 1234, 77, 0]
+
+
+def test_centavos_xml_sinal_e_casas_extras():
+    assert sx.centavos_xml('1234.56') == 123456
+    assert sx.centavos_xml('10') == 1000
+    assert sx.centavos_xml('.5') == 50
+    assert sx.centavos_xml('-1.50') == -150
+    assert sx.centavos_xml('-0.05') == -5
+    assert sx.centavos_xml('1.005') == 101
+    assert sx.centavos_xml('-1.005') == -101
+    assert sx.centavos_xml('2.0049') == 200
+    assert sx.centavos_xml('12345678901234.995') == 1234567890123500
+
+
+def test_unir_categorias_com_zeros_a_esquerda_entre_blocos():
+    blocos = [pd.Series(['1', '2', None], dtype='category'), pd.Series(['01', '2'], dtype='category')]
+    unida = sx.unir_categorias(blocos)
+    assert list(unida.categories) == [1, 2]
+    valores = pd.Series(unida)
+    assert valores.isna().tolist() == [False, False, True, False, False]
+    assert valores.dropna().tolist() == [1, 2, 1, 2]
@@ -0,0 +1,34 @@
+import os
+import shutil
+
+import pytest
+
+import sistem_vs_xml as sx
+
+PASTA_XML = os.path.join(os.path.dirname(__file__), 'fixtures', 'xml')
+
+
+@pytest.fixture
+def raiz(tmp_path):
+    raiz = tmp_path / 'nfe'
+    for pasta in ('enviado', 'eventos', 'recusado'):
+        (raiz / pasta).mkdir(parents=True)
+    # Mesma nota (mesma chave) com nomes diferentes: a cópia da raiz tem outro vNF para saber qual ficou
+    with open(os.path.join(PASTA_XML, 'utf8_prefixo.xml'), 'rb') as f:
+        conteudo = f.read()
+    (raiz / 'enviado' / 'a-nota1.xml').write_bytes(conteudo)
+    (raiz / 'z-nota1.xml').write_bytes(conteudo.replace(b'<nfe:vNF>25.00<', b'<nfe:vNF>50.00<'))
+    # Notas diferentes com o mesmo nome de arquivo: as duas contam
+    shutil.copy(os.path.join(PASTA_XML, 'utf8_namespace_padrao.xml'), raiz / 'mesmo-nome.xml')
+    shutil.copy(os.path.join(PASTA_XML, 'utf16_prefixo_dhemi_no_fim.xml'), raiz / 'enviado' / 'mesmo-nome.xml')
+    return raiz
+
+
+@pytest.mark.parametrize('com_indice', [False, True])
+def test_duplicata_pela_chave_vale_a_raiz_antes_de_enviado(raiz, tmp_path, com_indice):
+    resumo = {}
+    caminho_indice = str(tmp_path / 'indice.sqlite') if com_indice else None
+    df = sx.buscar_xml_por_data(caminho_indice=caminho_indice, data_inicial='01/05/2026', data_final='31/05/2026',
+                                raizes=[str(raiz)], resumo=resumo)
+    assert resumo['duplicatas'] == 1
+    assert dict(zip(df['NF-E'], df['Valor XML'])) == {1: 50.0, 2: 1234.56, 5: 7.0}
@@ -0,0 +1,55 @@
+import sistem_vs_xml as sx
+
+
+def _evento_inu(pasta, nome):
+    (pasta / nome).write_text('<retInutNFe><xJust>NOTA NAO AUTORIZADA</xJust></retInutNFe>', encoding='utf-8')
+
+
+def test_inutilizacao_de_nnf_com_9_digitos_no_indice_e_no_glob(tmp_path):
+    eventos = tmp_path / 'eventos'
+    eventos.mkdir()
+    _evento_inu(eventos, '123456789.inu')
+    _evento_inu(eventos, '00000042.inu')
+    indice_eventos = sx.carregar_indice_eventos([str(eventos)], [])
+    for nfe_num in (123456789, 42):
+        assert sx.verificar_inutilizacao_nota_nao_autorizada([str(eventos)], nfe_num) == 'NOTA NAO AUTORIZADA'
+        assert sx.verificar_inutilizacao_nota_nao_autorizada([str(eventos)], nfe_num,
+                                                              indice_eventos) == 'NOTA NAO AUTORIZADA'
+
+
+# Textos exatos que as comparações por substring (versão anterior) reconheciam
+JUSTIFICATIVAS_ANTIGAS = [
+    '<xJust>NOTA NAO AUTORIZADA</xJust>', '<xJust>NOTA NAO APARECE NO SEFAZ</xJust>', '<xServ>INUTILIZAR</xServ>',
+    '<xJust>ERRO NO SEFAZ................</xJust>', '<xJust>MERCADO NAO QUIS RECEBER</xJust>',
+    '<xJust>MERCADORIA FOI DUAS VEZES NO DIA</xJust>', '<xJust>ERRO NA PESAGEM</xJust>',
+    '<xJust>NAO APARECE NO SEFAZ....</xJust>', '<xJust>IMPOSTO ERRADO......</xJust>',
+    '<xJust>IMPOSTO ERRADO.....</xJust>', '<xJust>IMPOSTO ERRADO............</xJust>',
+    '<xJust>FORA DE HORARIO....</xJust>', '<xJust>NAO APARECEU NO SEFAZ</xJust>',
+    '<xJust>ERRO NO SEFAZ..............</xJust>', '<xJust>ERRO NO SEFAZ............</xJust>',
+    '<xJust>CARRO QUEBROU.........</xJust>', '<xJust>CARRO QUEBROU..........</xJust>',
+    '<xJust>CARRO QUEBROU...........</xJust>',
+]
+REJEICOES_ANTIGAS = {
+    '501': '501 : Rejeição: Pedido de Cancelamento intempestivo',
+    '493': '493 : Rejeição: Evento não atende o Schema XML específico',
+    '221': '221 : Rejeição: Confirmado o recebimento da NF-e pelo destinatário',
+    '241': '241 : Rejeição: Um número da faixa já foi utilizado',
+}
+
+
+def test_regras_reconhecem_tudo_que_as_comparacoes_antigas_reconheciam():
+    for justificativa in JUSTIFICATIVAS_ANTIGAS:
+        conteudo = f'<retInutNFe><infInut>{justificativa}</infInut></retInutNFe>'
+        texto = justificativa.split('>', 1)[1].split('<', 1)[0].rstrip('.')
+        assert sx.buscar_regra(sx.MATCHER_INUTILIZACAO, conteudo) == texto
+    for codigo, mensagem in REJEICOES_ANTIGAS.items():
+        assert sx.buscar_regra(sx.MATCHER_RECUSADO, f'cStat {mensagem} (lote 1)') == codigo
+
+
+def test_regras_nao_reconhecem_textos_que_as_comparacoes_antigas_rejeitavam():
+    for conteudo in ['<xJust>NOTA AUTORIZADA</xJust>', '<xJust>IMPOSTO ERRADO NO ITEM</xJust>',
+                     '<xServ>NOTA NAO AUTORIZADA</xServ>', '<xJust>INUTILIZAR</xJust>', 'NOTA NAO AUTORIZADA']:
+        assert sx.buscar_regra(sx.MATCHER_INUTILIZACAO, conteudo) is None
+    for conteudo in ['501 : Rejeição: Pedido de Cancelamento aceito',
+                     '502 : Rejeição: Pedido de Cancelamento intempestivo']:
+        assert sx.buscar_regra(sx.MATCHER_RECUSADO, conteudo) is None
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+import sistem_vs_xml as sx
+
+PASTA_XML = os.path.join(os.path.dirname(__file__), 'fixtures', 'xml')
+
+# Campos esperados de cada XML do corpus (UTF-8/ISO/UTF-16, com e sem prefixo, dhEmi no início e no fim)
+ESPERADOS = {
+    'utf8_prefixo.xml': {'cNF': '5001', 'nNF': '1', 'vNF': '25.00', 'dhEmi': '2026-05-04T08:15:00-03:00'},
+    'utf8_namespace_padrao.xml': {'cNF': '5002', 'nNF': '2', 'vNF': '1234.56', 'dhEmi': '2026-05-05T09:00:00-03:00'},
+    'utf16_namespace_padrao.xml': {'cNF': '5003', 'nNF': '3', 'vNF': '0.10', 'dhEmi': '2026-05-06T10:30:00-03:00'},
+    'iso_dhemi_no_fim.xml': {'cNF': '5004', 'nNF': '4', 'vNF': '99.90', 'dhEmi': '2026-05-07T11:45:00-03:00'},
+    'utf16_prefixo_dhemi_no_fim.xml': {'cNF': '5005', 'nNF': '5', 'vNF': '7.00',
+                                       'dhEmi': '2026-05-08T12:00:00-03:00'},
+}
+
+
+@pytest.mark.parametrize('nome', sorted(ESPERADOS))
+def test_extrator_por_bytes_igual_ao_parse_completo(nome):
+    with open(os.path.join(PASTA_XML, nome), 'rb') as f:
+        conteudo = sx.normalizar_bytes_xml(f.read())
+    assert sx.extrair_campos_nfe_arvore(conteudo) == ESPERADOS[nome]
+    assert sx.extrair_campos_nfe(conteudo) == ESPERADOS[nome]
+
+
+def test_verificar_extrator_xml_aceita_o_corpus():
+    assert sorted(os.listdir(PASTA_XML)) == sorted(ESPERADOS)
+    assert sx.verificar_extrator_xml([PASTA_XML])
+
+
+# NF-E de cada XML aceito como venda; os demais têm outra natOp e são descartados
+NOTAS_VENDA = {'utf8_prefixo.xml': 1, 'utf8_namespace_padrao.xml': 2, 'utf16_prefixo_dhemi_no_fim.xml': 5}
+
+
+@pytest.mark.parametrize('nome', sorted(ESPERADOS))
+def test_processar_xml_completo_aceita_vendas_com_e_sem_prefixo(nome):
+    nota = sx.processar_xml_completo(os.path.join(PASTA_XML, nome), set(), [], [])
+    if nome in NOTAS_VENDA:
+        assert nota['NF-E'] == NOTAS_VENDA[nome]
+        assert nota['Centavos XML'] == sx.centavos_xml(ESPERADOS[nome]['vNF'])
+    else:
+        assert nota is None
@@ -0,0 +1,13 @@
+import pandas as pd
+
+import sistem_vs_xml as sx
+
+
+def test_historico_iterativo_nao_altera_o_faturamento_recebido():
+    df_principal = pd.DataFrame({'ROMANEIO': [1, 1], 'NF-E': [10, 10], 'CODPRODUTO': [100, 200], 'PESO': [0.0, 0.0]})
+    df_historico = pd.DataFrame({'ROMANEIO': [1], 'NOTA FISCAL': [10], 'PRODUTO': [100], 'HISTORICO': ['51'],
+                                 'PESO': ['2,5']})
+    resultado = sx.aplicar_historico_iterativo(df_principal, df_historico)
+    assert resultado is not df_principal
+    assert resultado['PESO'].tolist() == [2.5, 0.0]
+    assert df_principal['PESO'].tolist() == [0.0, 0.0]
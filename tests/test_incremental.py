@@ -0,0 +1,39 @@
+import os
+import shutil
+
+import sistem_vs_xml as sx
+
+PASTA_XML = os.path.join(os.path.dirname(__file__), 'fixtures', 'xml')
+
+
+def test_incremental_reprocessa_notas_com_evento_novo_ou_regras_alteradas(tmp_path, monkeypatch):
+    raiz = tmp_path / 'nfe'
+    for pasta in ('enviado', 'eventos', 'recusado'):
+        (raiz / pasta).mkdir(parents=True)
+    shutil.copy(os.path.join(PASTA_XML, 'utf8_prefixo.xml'), raiz / 'nota1.xml')
+    shutil.copy(os.path.join(PASTA_XML, 'utf8_namespace_padrao.xml'), raiz / 'nota2.xml')
+
+    # Quais XMLs cada execução leu de novo
+    processar_arquivos_xml = sx.processar_arquivos_xml
+    lidos = []
+
+    def processar_registrando(arquivos, *args, **kwargs):
+        lidos.append(sorted(os.path.basename(arquivo) for arquivo in arquivos))
+        return processar_arquivos_xml(arquivos, *args, **kwargs)
+
+    monkeypatch.setattr(sx, 'processar_arquivos_xml', processar_registrando)
+
+    def executar():
+        df = sx.buscar_xml_por_data(caminho_indice=str(tmp_path / 'indice.sqlite'), incremental=True,
+                                    data_inicial='01/05/2026', data_final='31/05/2026', raizes=[str(raiz)], resumo={})
+        return sorted(df['NF-E'])
+
+    assert executar() == [1, 2]
+    assert executar() == [1, 2]
+    # Cancelamento novo da nota 1: só ela é lida de novo
+    (raiz / 'eventos' / '00000001.can').write_text('cancelada', encoding='utf-8')
+    assert executar() == [2]
+    # Regras de eventos alteradas: nenhum resultado salvo vale
+    monkeypatch.setattr(sx, 'VERSAO_REGRAS', 'alterada')
+    assert executar() == [2]
+    assert lidos == [['nota1.xml', 'nota2.xml'], [], ['nota1.xml'], ['nota1.xml', 'nota2.xml']]